@@ -1,100 +1,589 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional
 from decimal import Decimal, getcontext
 import math
 
+from bitstream import BitReader, BitWriter, payload_bit_length, to_bit_string
+from instrumentation import metrics
+from models import (
+    DEFAULT_ORDER, DEFAULT_SLOT_CAPACITY, DEFAULT_TABLE_SIZE, AdaptiveModel,
+    ContextModel, context_table_size
+)
+from results import EncodeResult, ResultCache, encode_with_stats
+from utils import BYTE_ALPHABET, byte_view, is_byte_data, resolve_alphabet
+
 getcontext().prec = 1000
+# The decimal engine refuses input once the interval is within this many
+# digits of the precision, where the label would stop being exact
+DECIMAL_GUARD_DIGITS = 10
 
 
-def decimal_to_binary_fraction(f: Decimal, length: int) -> str:
-    s = ''
-    for _ in range(length):
-        f *= Decimal('2')
-        if f >= Decimal('1'):
-            s += '1'
-            f -= Decimal('1')
-        else:
-            s += '0'
-    return s
-
-
-def binary_to_decimal_fraction(code: str) -> Decimal:
-    f = Decimal('0')
-    p = Decimal('1') / Decimal('2')
-    for bit in code:
-        if bit == '1':
-            f += p
-        p /= Decimal('2')
-    return f
-
-
-def construct_line(symbols: List[str], probabilities: List[Decimal], prev: Decimal = Decimal('0'), inter: Decimal = Decimal('1')) -> Dict[str, Tuple[Decimal, Decimal]]:
-    line = {}
-    for i, sigma in enumerate(symbols):
-        next_ = prev + probabilities[i] * inter
-        line[sigma] = (prev, next_)
-        prev = next_
-    return line
-
-
-def adaptive_arithmetic_encode(sequence: str) -> str:
-    symbols: List[str] = sorted(list(set(sequence)))
-    counts: Dict[str, Decimal] = {sigma: Decimal('1') for sigma in symbols}
-    total: Decimal = Decimal(len(symbols))
-    line: Dict[str, Tuple[Decimal, Decimal]] = construct_line(
-        symbols,
-        [counts[sigma] / total for sigma in symbols]
-    )
+def decimal_to_binary_fraction(f: Decimal, length: int) -> int:
+    # The first `length` bits of the fraction, read as an integer
+    return int(f * Decimal(2) ** length)
+
+
+def binary_to_decimal_fraction(value: int, length: int) -> Decimal:
+    return Decimal(value) / Decimal(2) ** length
+
+
+def decimal_arithmetic_encode(sequence: str) -> bytes:
+    if is_byte_data(sequence):
+        # Bytes are coded over all 256 values, no need to look for symbols
+        sequence = byte_view(sequence)
+        index = BYTE_ALPHABET
+        model = AdaptiveModel(len(BYTE_ALPHABET))
+    else:
+        symbols: List[str] = sorted(list(set(sequence)))
+        index: Dict[str, int] = {sigma: i for i, sigma in enumerate(symbols)}
+        model = AdaptiveModel(len(symbols))
     prev: Decimal = Decimal('0')
     inter: Decimal = Decimal('1')
     for char in sequence:
-        prev, nxt = line[char]
-        inter = nxt - prev
-        counts[char] += Decimal('1')
-        total += Decimal('1')
-        probabilities = [counts[sigma] / total for sigma in symbols]
-        line = construct_line(symbols, probabilities, prev=prev, inter=inter)
+        i = index[char]
+        low, high = model.interval(i)
+        total = Decimal(model.total)
+        prev += inter * low / total
+        inter = inter * (high - low) / total
+        if inter.adjusted() < DECIMAL_GUARD_DIGITS - getcontext().prec:
+            raise ValueError("Input is too long for the decimal engine's "
+                             "precision, use the integer engine.")
+        model.update(i)
     label: Decimal = prev + inter / Decimal('2')
     ln2 = Decimal('2').ln()
     minus_log2 = - (inter.ln() / ln2)
     length: int = math.ceil(float(minus_log2)) + 1
-    encoded: str = decimal_to_binary_fraction(label, length)
-    return encoded
-
-
-def adaptive_arithmetic_decode(code: str, alphabet: List[str],
-                               length: int) -> str:
-    counts: Dict[str, Decimal] = {sigma: Decimal('1') for sigma in alphabet}
-    total: Decimal = Decimal(len(alphabet))
-    line: Dict[str, Tuple[Decimal, Decimal]] = construct_line(
-        alphabet,
-        [counts[sigma] / total for sigma in alphabet]
-    )
-    label: Decimal = binary_to_decimal_fraction(code)
+    writer = BitWriter()
+    writer.write(decimal_to_binary_fraction(label, length), length)
+    return writer.finish()
+
+
+def decimal_arithmetic_decode(code: bytes, alphabet: Optional[List[str]],
+                              length: int):
+    byte_mode = alphabet is None
+    if byte_mode:
+        alphabet = BYTE_ALPHABET
+    model = AdaptiveModel(len(alphabet))
+    reader = BitReader(code, terminated=True)
+    label: Decimal = binary_to_decimal_fraction(
+        reader.read(len(reader)), len(reader))
     prev: Decimal = Decimal('0')
     inter: Decimal = Decimal('1')
-    decoded: str = ""
+    decoded: List[str] = []
     for _ in range(length):
-        for sigma in alphabet:
-            next_ = line[sigma][1]
-            if prev <= label < next_:
-                decoded += sigma
-                prev, next_ = line[sigma]
-                inter = next_ - prev
-                counts[sigma] += Decimal('1')
-                total += Decimal('1')
-                probabilities = [counts[s] / total for s in alphabet]
-                line = construct_line(alphabet, probabilities,
-                                      prev=prev, inter=inter)
-                break
-    return decoded
-
-
-def calculate_adaptive_efficiency(sequence: str, alphabet: list) -> float:
-    encoded = adaptive_arithmetic_encode(sequence)
-    coded_length = len(encoded)
-    original_length = len(sequence) * math.ceil(math.log2(len(alphabet)))
-    efficiency =  coded_length / original_length
-    return efficiency
+        total = Decimal(model.total)
+        target = int((label - prev) * total / inter)
+        i = model.find(target)
+        low, high = model.interval(i)
+        decoded.append(alphabet[i])
+        prev += inter * low / total
+        inter = inter * (high - low) / total
+        model.update(i)
+    if byte_mode:
+        return bytes(decoded)
+    return "".join(decoded)
+
+
+# Integer engine: 32-bit low/high registers, renormalized after every symbol
+# so precision never runs out no matter how long the input is.
+STATE_BITS = 32
+STATE_MASK = (1 << STATE_BITS) - 1
+HALF = 1 << (STATE_BITS - 1)
+QUARTER = 1 << (STATE_BITS - 2)
+
+
+def check_inline_model(model: Optional[AdaptiveModel]):
+    if model is not None and type(model) is not AdaptiveModel:
+        raise TypeError(
+            f"{type(model).__name__} cannot be walked inline; code it "
+            "through SymbolEncoder/SymbolDecoder (model_arithmetic_encode "
+            "and model_arithmetic_decode).")
+
+
+class ArithmeticEncoder:
+    """Incremental integer-engine encoder.
+
+    `feed` codes a chunk of symbols and returns the bytes that are already
+    settled; `flush` closes the stream and returns the rest. The alphabet
+    must be known up front since there is no whole input to scan. With
+    `alphabet=None` the encoder is fed bytes-like chunks instead of text.
+
+    The model's Fenwick tree is walked inline, so only a plain
+    `AdaptiveModel` is accepted; models that override its methods are
+    coded through `SymbolEncoder` (see `integer_arithmetic_encode`).
+    """
+
+    def __init__(self, alphabet: Optional[List[str]],
+                 model: Optional[AdaptiveModel] = None):
+        check_inline_model(model)
+        if alphabet is None:
+            alphabet = BYTE_ALPHABET
+            # A byte already is its own index
+            self.index = BYTE_ALPHABET
+        else:
+            self.index = {sigma: i for i, sigma in enumerate(alphabet)}
+        self.model = model if model is not None else \
+            AdaptiveModel(len(alphabet))
+        self.low: int = 0
+        self.high: int = STATE_MASK
+        self.pending: int = 0
+        self.writer = BitWriter()
+
+    @metrics.timed("arithmetic.encode")
+    def feed(self, chunk: str) -> bytes:
+        if is_byte_data(chunk):
+            chunk = byte_view(chunk)
+        index = self.index
+        model = self.model
+        writer = self.writer
+        write = writer.write
+        # The model's Fenwick tree is walked here rather than through its
+        # methods, which would cost several calls per symbol
+        counts, tree, total = model.counts, model.tree, model.total
+        size, increment, max_total = model.size, model.increment, \
+            model.max_total
+        low, high, pending = self.low, self.high, self.pending
+        # Every renormalization shifts out one bit, written or pending
+        shifted = len(writer) + pending
+        # Output bits are gathered here and handed to the writer in runs
+        bits = 0
+        nbits = 0
+        symbols = chunk if index is BYTE_ALPHABET else \
+            map(index.__getitem__, chunk)
+        for i in symbols:
+            sym_low = 0
+            j = i
+            while j:
+                sym_low += tree[j]
+                j &= j - 1
+            rng = high - low + 1
+            high = low + rng * (sym_low + counts[i]) // total - 1
+            low = low + rng * sym_low // total
+            # E1/E2: shift out every leading bit low and high agree on at
+            # once. The first is followed by the pending opposite bits.
+            shared = STATE_BITS - (low ^ high).bit_length()
+            if shared:
+                rest = shared - 1
+                head = 1 << pending if high >= HALF else (1 << pending) - 1
+                bits = (bits << (pending + shared)) | (head << rest) | (
+                    (high >> (STATE_BITS - shared)) & ((1 << rest) - 1))
+                nbits += pending + shared
+                pending = 0
+                low = (low << shared) & STATE_MASK
+                high = ((high << shared) & STATE_MASK) | ((1 << shared) - 1)
+                if nbits >= 64:
+                    write(bits, nbits)
+                    bits = nbits = 0
+            # E3: straddling the middle, defer the bit. Afterwards low and
+            # high still differ in their top bit, so no E1/E2 can follow.
+            while low >= QUARTER and high < HALF + QUARTER:
+                pending += 1
+                low = (low - QUARTER) << 1
+                high = ((high - QUARTER) << 1) | 1
+            counts[i] += increment
+            total += increment
+            j = i + 1
+            while j <= size:
+                tree[j] += increment
+                j += j & -j
+            if total >= max_total:
+                model.total = total
+                model.rescale()
+                counts, tree, total = model.counts, model.tree, model.total
+        write(bits, nbits)
+        model.total = total
+        self.low, self.high, self.pending = low, high, pending
+        if metrics.enabled:
+            metrics.count("arithmetic.symbols", len(chunk))
+            metrics.count("arithmetic.renormalizations",
+                          len(writer) + pending - shifted)
+        return writer.take()
+
+    def flush(self) -> bytes:
+        if metrics.enabled:
+            metrics.count("arithmetic.bits", len(self.writer) + 1)
+        # low < HALF <= high here, so a single 1 followed by the pending 0s
+        # (which the decoder reads as zero padding) lands inside the interval
+        self.writer.write(1, 1)
+        return self.writer.finish()
+
+
+class ArithmeticDecoder:
+    """Incremental integer-engine decoder for a stream of `length` symbols.
+
+    `feed` takes the next piece of the coded bytes and returns the symbols
+    it could decode. A symbol is only decoded once enough real bits follow
+    it, since the last byte seen so far may still hold the stop bit;
+    `flush` decodes whatever is left. Symbols come back as `decode_symbols`
+    gives them. As with `ArithmeticEncoder`, the model must be a plain
+    `AdaptiveModel`.
+    """
+
+    def __init__(self, alphabet: Optional[List[str]], length: int,
+                 model: Optional[AdaptiveModel] = None):
+        check_inline_model(model)
+        self.byte_mode: bool = alphabet is None
+        if alphabet is None:
+            alphabet = BYTE_ALPHABET
+        self.alphabet = alphabet
+        self.length = length
+        self.model = model if model is not None else \
+            AdaptiveModel(len(alphabet))
+        self.low: int = 0
+        self.high: int = STATE_MASK
+        self.value: int = 0
+        self.primed: bool = False
+        self.decoded: int = 0
+        self.buffer: bytes = b""
+        self.position: int = 0
+
+    def feed(self, data: bytes):
+        self.buffer = self.buffer + bytes(data)
+        # Hold back the last byte, it may end in the stop bit
+        return self._decode(max(0, len(self.buffer) - 1) * 8, final=False)
+
+    def flush(self):
+        return self._decode(payload_bit_length(self.buffer), final=True)
+
+    @metrics.timed("arithmetic.decode")
+    def _decode(self, end: int, final: bool):
+        buffer = self.buffer
+        position = self.position
+        # Renormalizing after one symbol never shifts in more bits than
+        # the registers hold, so that much lookahead is always enough
+        if not self.primed:
+            if end - position < STATE_BITS and not final:
+                return b"" if self.byte_mode else ""
+            reader = BitReader(buffer, bit_length=end)
+            reader.position = position
+            self.value = reader.read(STATE_BITS, pad=True)
+            position += STATE_BITS
+            self.primed = True
+        model = self.model
+        counts, tree, total = model.counts, model.tree, model.total
+        size, increment, max_total = model.size, model.increment, \
+            model.max_total
+        steps = [1 << k for k in reversed(range(model.top.bit_length()))]
+        alphabet = self.alphabet
+        low, high, value = self.low, self.high, self.value
+        # Zero padding, so a read of up to 32 bits never runs off the end
+        padded = buffer + bytes(5)
+        decoded = bytearray() if self.byte_mode else []
+        put = decoded.append
+        remaining = self.length - self.decoded
+        while remaining and (final or end - position >= STATE_BITS):
+            rng = high - low + 1
+            target = ((value - low + 1) * total - 1) // rng
+            # Descend the model's Fenwick tree to the symbol holding
+            # `target`; what is left of it gives the symbol's low count
+            i = 0
+            rest = target
+            for step in steps:
+                candidate = i + step
+                if candidate <= size:
+                    count = tree[candidate]
+                    if count <= rest:
+                        rest -= count
+                        i = candidate
+            sym_low = target - rest
+            put(alphabet[i])
+            high = low + rng * (sym_low + counts[i]) // total - 1
+            low = low + rng * sym_low // total
+            # E1/E2 for every leading bit low and high agree on, shifting
+            # in as many code bits at once
+            shared = STATE_BITS - (low ^ high).bit_length()
+            if shared:
+                low = (low << shared) & STATE_MASK
+                high = ((high << shared) & STATE_MASK) | ((1 << shared) - 1)
+                value = (value << shared) & STATE_MASK
+                if position < end:
+                    k = position >> 3
+                    bits = (int.from_bytes(padded[k:k + 5], "big") >> (
+                        40 - (position & 7) - shared)) & ((1 << shared) - 1)
+                    if position + shared > end:
+                        # Bits past the end of the code are read as zeros
+                        over = position + shared - end
+                        bits = bits >> over << over
+                    value |= bits
+                position += shared
+            # E3, which leaves low and high straddling the middle
+            while low >= QUARTER and high < HALF + QUARTER:
+                low = (low - QUARTER) << 1
+                high = ((high - QUARTER) << 1) | 1
+                value = (value - QUARTER) << 1
+                if position < end:
+                    value |= (buffer[position >> 3] >> (7 - (position & 7))) \
+                        & 1
+                position += 1
+            counts[i] += increment
+            total += increment
+            j = i + 1
+            while j <= size:
+                tree[j] += increment
+                j += j & -j
+            if total >= max_total:
+                model.total = total
+                model.rescale()
+                counts, tree, total = model.counts, model.tree, model.total
+            remaining -= 1
+        model.total = total
+        self.low, self.high, self.value = low, high, value
+        if metrics.enabled:
+            metrics.count("arithmetic.symbols_decoded",
+                          self.length - remaining - self.decoded)
+            metrics.count("arithmetic.renormalizations",
+                          position - self.position)
+        self.decoded = self.length - remaining
+        # Drop the bytes that have been read completely
+        consumed = min(position, end) >> 3
+        self.buffer = buffer[consumed:]
+        self.position = position - consumed * 8
+        if self.byte_mode:
+            return bytes(decoded)
+        return "".join(decoded)
+
+
+class SymbolEncoder:
+    """Integer-engine encoder driven one symbol at a time.
+
+    Every call names the model to code with, so a single stream can
+    interleave several models (see hybrid.py). `encode_bits` codes raw
+    bits with no model at all, and `encode_interval` lets a model such as
+    `ContextModel` code a symbol in several steps. `finish` closes the stream the same way
+    `ArithmeticEncoder.flush` does.
+    """
+
+    def __init__(self):
+        self.low: int = 0
+        self.high: int = STATE_MASK
+        self.pending: int = 0
+        self.writer = BitWriter()
+
+    def encode(self, model: AdaptiveModel, symbol: int):
+        sym_low, sym_high = model.interval(symbol)
+        self.encode_interval(sym_low, sym_high, model.total)
+        model.update(symbol)
+
+    def encode_bits(self, value: int, width: int):
+        # At most 16 bits at a time, the same bound as a model total
+        while width > 0:
+            step = min(width, 16)
+            width -= step
+            part = (value >> width) & ((1 << step) - 1)
+            self.encode_interval(part, part + 1, 1 << step)
+
+    def encode_interval(self, sym_low: int, sym_high: int, total: int):
+        """Code the interval [sym_low, sym_high) out of `total`."""
+        low, high, pending = self.low, self.high, self.pending
+        rng = high - low + 1
+        high = low + rng * sym_high // total - 1
+        low = low + rng * sym_low // total
+        # E1/E2 for all the leading bits low and high share, in one write,
+        # as in ArithmeticEncoder.feed
+        shared = STATE_BITS - (low ^ high).bit_length()
+        if shared:
+            rest = shared - 1
+            head = 1 << pending if high >= HALF else (1 << pending) - 1
+            self.writer.write(
+                (head << rest) | ((high >> (STATE_BITS - shared))
+                                  & ((1 << rest) - 1)), pending + shared)
+            pending = 0
+            low = (low << shared) & STATE_MASK
+            high = ((high << shared) & STATE_MASK) | ((1 << shared) - 1)
+        while low >= QUARTER and high < HALF + QUARTER:
+            pending += 1
+            low = (low - QUARTER) << 1
+            high = ((high - QUARTER) << 1) | 1
+        self.low, self.high, self.pending = low, high, pending
+
+    def finish(self) -> bytes:
+        self.writer.write(1, 1)
+        return self.writer.finish()
+
+
+class SymbolDecoder:
+    """Decodes a whole stream written by `SymbolEncoder`.
+
+    The caller must ask for the same models (and raw bit widths) in the
+    same order as they were encoded.
+    """
+
+    def __init__(self, code: bytes):
+        self.reader = BitReader(code, terminated=True)
+        self.low: int = 0
+        self.high: int = STATE_MASK
+        self.value: int = self.reader.read(STATE_BITS, pad=True)
+
+    def decode(self, model: AdaptiveModel) -> int:
+        total = model.total
+        symbol = model.find(self.target(total))
+        sym_low, sym_high = model.interval(symbol)
+        self.decode_interval(sym_low, sym_high, total)
+        model.update(symbol)
+        return symbol
+
+    def decode_bits(self, width: int) -> int:
+        value = 0
+        while width > 0:
+            step = min(width, 16)
+            width -= step
+            total = 1 << step
+            part = self.target(total)
+            self.decode_interval(part, part + 1, total)
+            value = (value << step) | part
+        return value
+
+    def target(self, total: int) -> int:
+        """Where the code value falls, scaled to `total`. The interval
+        holding it must then be passed to `decode_interval`.
+        """
+        rng = self.high - self.low + 1
+        return ((self.value - self.low + 1) * total - 1) // rng
+
+    def decode_interval(self, sym_low: int, sym_high: int, total: int):
+        reader = self.reader
+        low, high, value = self.low, self.high, self.value
+        rng = high - low + 1
+        high = low + rng * sym_high // total - 1
+        low = low + rng * sym_low // total
+        shared = STATE_BITS - (low ^ high).bit_length()
+        if shared:
+            low = (low << shared) & STATE_MASK
+            high = ((high << shared) & STATE_MASK) | ((1 << shared) - 1)
+            value = ((value << shared) & STATE_MASK) | \
+                reader.read(shared, pad=True)
+        while low >= QUARTER and high < HALF + QUARTER:
+            low = (low - QUARTER) << 1
+            high = ((high - QUARTER) << 1) | 1
+            value = ((value - QUARTER) << 1) | reader.read_bit()
+        self.low, self.high, self.value = low, high, value
+
+
+@metrics.timed("arithmetic.encode")
+def model_arithmetic_encode(sequence: str, alphabet: Optional[List[str]],
+                            model) -> bytes:
+    """Code `sequence` with any model that codes its own symbols through a
+    `SymbolEncoder`, such as a `ContextModel`.
+    """
+    if alphabet is None:
+        sequence = byte_view(sequence)
+        index = BYTE_ALPHABET
+    else:
+        index = {sigma: i for i, sigma in enumerate(alphabet)}
+    encoder = SymbolEncoder()
+    encode = model.encode
+    for char in sequence:
+        encode(encoder, index[char])
+    if metrics.enabled:
+        metrics.count("arithmetic.symbols", len(sequence))
+        metrics.count("arithmetic.renormalizations",
+                      len(encoder.writer) + encoder.pending)
+        metrics.count("arithmetic.bits", len(encoder.writer) + 1)
+    return encoder.finish()
+
+
+@metrics.timed("arithmetic.decode")
+def model_arithmetic_decode(code: bytes, alphabet: Optional[List[str]],
+                            length: int, model):
+    byte_mode = alphabet is None
+    if byte_mode:
+        alphabet = BYTE_ALPHABET
+    decoder = SymbolDecoder(code)
+    decode = model.decode
+    decoded = [alphabet[decode(decoder)] for _ in range(length)]
+    if metrics.enabled:
+        metrics.count("arithmetic.symbols_decoded", length)
+        metrics.count("arithmetic.renormalizations",
+                      decoder.reader.position - STATE_BITS)
+    if byte_mode:
+        return bytes(decoded)
+    return "".join(decoded)
+
+
+def integer_arithmetic_encode(sequence: str, model=None) -> bytes:
+    alphabet = None if is_byte_data(sequence) else sorted(list(set(sequence)))
+    # Only a plain adaptive model takes the streaming encoder's inline path;
+    # anything else, subclasses included, is coded through its methods
+    if model is not None and type(model) is not AdaptiveModel:
+        return model_arithmetic_encode(sequence, alphabet, model)
+    encoder = ArithmeticEncoder(alphabet, model)
+    return encoder.feed(sequence) + encoder.flush()
+
+
+def integer_arithmetic_decode(code: bytes, alphabet: Optional[List[str]],
+                              length: int, model=None):
+    # Plain adaptive models take the streaming decoder's fast path
+    if model is not None and type(model) is not AdaptiveModel:
+        return model_arithmetic_decode(code, alphabet, length, model)
+    decoder = ArithmeticDecoder(alphabet, length, model)
+    return decoder.feed(code) + decoder.flush()
+
+
+def context_arithmetic_encode(sequence: str, order: int = DEFAULT_ORDER,
+                              table_size: int = DEFAULT_TABLE_SIZE,
+                              slot_capacity: int = DEFAULT_SLOT_CAPACITY
+                              ) -> bytes:
+    # `table_size` is the most slots per order, see context_table_size
+    size = len(BYTE_ALPHABET) if is_byte_data(sequence) \
+        else len(set(sequence))
+    table_size = context_table_size(len(sequence), table_size)
+    return integer_arithmetic_encode(
+        sequence, ContextModel(size, order, table_size,
+                               slot_capacity=slot_capacity))
+
+
+def context_arithmetic_decode(code: bytes, alphabet: Optional[List[str]],
+                              length: int, order: int = DEFAULT_ORDER,
+                              table_size: int = DEFAULT_TABLE_SIZE,
+                              slot_capacity: int = DEFAULT_SLOT_CAPACITY):
+    size = len(BYTE_ALPHABET if alphabet is None else alphabet)
+    table_size = context_table_size(length, table_size)
+    return integer_arithmetic_decode(
+        code, alphabet, length,
+        ContextModel(size, order, table_size, slot_capacity=slot_capacity))
+
+
+ARITHMETIC_ENGINES = {
+    "decimal": (decimal_arithmetic_encode, decimal_arithmetic_decode),
+    "integer": (integer_arithmetic_encode, integer_arithmetic_decode),
+    "context": (context_arithmetic_encode, context_arithmetic_decode),
+}
+
+
+def adaptive_arithmetic_encode(sequence: str, engine: str = "integer") -> bytes:
+    if engine not in ARITHMETIC_ENGINES:
+        raise ValueError(f"Unknown arithmetic engine: {engine!r}")
+    encode, _ = ARITHMETIC_ENGINES[engine]
+    return encode(sequence)
+
+
+def adaptive_arithmetic_decode(code: bytes, alphabet: Optional[List[str]],
+                               length: int, engine: str = "integer"):
+    # alphabet=None decodes the bytes coded from a bytes-like sequence
+    if engine not in ARITHMETIC_ENGINES:
+        raise ValueError(f"Unknown arithmetic engine: {engine!r}")
+    _, decode = ARITHMETIC_ENGINES[engine]
+    return decode(code, alphabet, length)
+
+
+def adaptive_arithmetic_encode_result(sequence: str,
+                                      alphabet: Optional[list] = None,
+                                      engine: str = "integer",
+                                      cache: Optional[ResultCache] = None
+                                      ) -> EncodeResult:
+    """Encode once and return the payload with its size, efficiency,
+    entropy and timing. `alphabet` is only used to size the uncoded input.
+    """
+    alphabet = resolve_alphabet(sequence, alphabet)
+    return encode_with_stats(
+        lambda: adaptive_arithmetic_encode(sequence, engine), sequence,
+        alphabet, cache, ("arithmetic", engine, list(alphabet)))
+
+
+def calculate_adaptive_efficiency(sequence: str,
+                                  alphabet: Optional[list] = None,
+                                  engine: str = "integer") -> float:
+    return adaptive_arithmetic_encode_result(
+        sequence, alphabet, engine).efficiency
 
 
 if __name__ == "__main__":
@@ -118,7 +607,7 @@ if __name__ == "__main__":
         print(f"Processing adaptive {name}")
         alphabet = sorted(list(set(seq)))
         adaptive_encoded = adaptive_arithmetic_encode(seq)
-        print(f"Adaptive Encoded {name}: {adaptive_encoded}")
+        print(f"Adaptive Encoded {name}: {to_bit_string(adaptive_encoded)}")
         # adaptive_decoded = adaptive_arithmetic_decode(
         #     adaptive_encoded, alphabet, len(seq))
         # print(f"Adaptive Decoded {name}: {adaptive_decoded}")
@@ -0,0 +1,339 @@
+import argparse
+import json
+import os
+import platform
+import random
+import struct
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from arithmetic import (
+    context_arithmetic_decode, context_arithmetic_encode,
+    integer_arithmetic_decode, integer_arithmetic_encode,
+    model_arithmetic_decode
+)
+from hybrid import hybrid_decode, hybrid_encode
+from lempel_ziv import (
+    lz_decode, lz_encode, lzss_decode, lzss_encode, lzw_decode, lzw_encode
+)
+from instrumentation import metrics
+from models import AdaptiveModel
+
+
+class LinearScanModel(AdaptiveModel):
+    """Reference model that finds symbols the way the decoder used to,
+    by walking the alphabet and summing counts until the target is passed.
+    """
+
+    def find(self, target: int) -> int:
+        high = 0
+        for symbol, count in enumerate(self.counts):
+            high += count
+            if target < high:
+                return symbol
+        raise ValueError("Target outside the model's total.")
+
+
+def time_call(func: Callable[[], object], repeats: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(func: Callable[[], object]) -> int:
+    """Peak bytes allocated by Python while `func` runs."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_decode(alphabet_size: int = 256, length: int = 100_000,
+                     repeats: int = 3, seed: int = 0):
+    rng = random.Random(seed)
+    alphabet: List[str] = [chr(0x100 + i) for i in range(alphabet_size)]
+    sequence = "".join(rng.choice(alphabet) for _ in range(length))
+    alphabet = sorted(set(sequence))
+    encoded = integer_arithmetic_encode(sequence)
+
+    # Both models decode through their methods, so the two runs differ only
+    # in `find`; integer_arithmetic_decode would walk a plain AdaptiveModel
+    # inline and never call it
+    def decode_with(model_class):
+        def run():
+            decoded = model_arithmetic_decode(
+                encoded, alphabet, length, model_class(len(alphabet)))
+            assert decoded == sequence, "Decoded sequence does not match!"
+        return run
+
+    linear = time_call(decode_with(LinearScanModel), repeats)
+    tree = time_call(decode_with(AdaptiveModel), repeats)
+    print(f"Decode {length} symbols over {len(alphabet)}-symbol alphabet")
+    print(f"  linear scan : {linear:.3f}s ({length / linear:,.0f} symbols/s)")
+    print(f"  tree descent: {tree:.3f}s ({length / tree:,.0f} symbols/s)")
+    print(f"  speedup     : {linear / tree:.2f}x")
+
+
+# Corpora are generated from a seed, so the same arguments give the same
+# bytes on every run and results from different commits line up.
+
+WORDS = (
+    "the of and to in is was that for it with as his on be at by this had "
+    "not are but from or have an they which one you were her all she there "
+    "would their we him been has when who will more no if out so said what "
+    "up its about into than them can only other new some could time these "
+    "two may then do first any my now such like our over man me even most "
+    "made after also did many before must through back years where much "
+    "your way well down should because each just those people how too "
+    "little state good very make world still own see men work long get here "
+    "between both life being under never day same another know while last "
+    "might us great old year off come since against go came right used take "
+    "three coding symbol interval model entropy dictionary compression"
+).split()
+
+
+def random_corpus(size: int, seed: int) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def repetitive_corpus(size: int, seed: int) -> bytes:
+    # A few short phrases repeated with the occasional typo
+    rng = random.Random(seed)
+    phrases = [rng.randbytes(rng.randint(4, 24)) for _ in range(8)]
+    out = bytearray()
+    while len(out) < size:
+        phrase = bytearray(rng.choice(phrases))
+        if rng.random() < 0.05:
+            phrase[rng.randrange(len(phrase))] = rng.randrange(256)
+        out += phrase
+    return bytes(out[:size])
+
+
+def english_corpus(size: int, seed: int) -> bytes:
+    # Words drawn with Zipf-like frequencies, in sentences
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(WORDS))]
+    out: List[str] = []
+    length = 0
+    while length < size:
+        words = rng.choices(WORDS, weights, k=rng.randint(5, 20))
+        sentence = " ".join(words).capitalize() + ". "
+        out.append(sentence)
+        length += len(sentence)
+    return "".join(out).encode("ascii")[:size]
+
+
+def binary_corpus(size: int, seed: int) -> bytes:
+    # Fixed-layout records: a counter, a slowly drifting float and flags
+    rng = random.Random(seed)
+    record = struct.Struct("<IdHBB")
+    out = bytearray()
+    value = 0.0
+    for i in range(size // record.size + 1):
+        value += rng.gauss(0, 1)
+        out += record.pack(i, value, rng.choice((0, 1, 2, 0xFFFF)),
+                           rng.randrange(4), 0)
+    return bytes(out[:size])
+
+
+CORPORA: Dict[str, Callable[[int, int], bytes]] = {
+    "random": random_corpus,
+    "repetitive": repetitive_corpus,
+    "english": english_corpus,
+    "binary": binary_corpus,
+}
+
+# Every engine codes bytes with the 256-symbol alphabet. The decimal engine
+# is left out, its precision only covers a few hundred symbols.
+ENGINES: Dict[str, Tuple[Callable[[bytes], bytes],
+                         Callable[[bytes, int], bytes]]] = {
+    "lz": (lz_encode, lambda code, length: lz_decode(code)),
+    "lzw": (lzw_encode, lambda code, length: lzw_decode(code)),
+    "lzss": (lzss_encode, lambda code, length: lzss_decode(code)),
+    "hybrid": (hybrid_encode, lambda code, length: hybrid_decode(code)),
+    "arithmetic": (integer_arithmetic_encode,
+                   lambda code, length: integer_arithmetic_decode(
+                       code, None, length)),
+    "context": (context_arithmetic_encode,
+                lambda code, length: context_arithmetic_decode(
+                    code, None, length)),
+}
+
+DEFAULT_SIZES = (16 * 1024, 64 * 1024)
+
+
+def benchmark_engine(engine: str, corpus: str, data: bytes,
+                     repeats: int = 3,
+                     collect_metrics: bool = False) -> Dict[str, Any]:
+    """Time, measure and round-trip one engine on one corpus."""
+    encode, decode = ENGINES[engine]
+    encoded = encode(data)
+    if decode(encoded, len(data)) != data:
+        raise AssertionError(f"{engine} did not round-trip {corpus}")
+    # Timings and memory come from separate runs, tracemalloc slows
+    # everything it traces
+    encode_time = time_call(lambda: encode(data), repeats)
+    decode_time = time_call(lambda: decode(encoded, len(data)), repeats)
+    megabytes = len(data) / 1e6
+    result = {
+        "engine": engine,
+        "corpus": corpus,
+        "size": len(data),
+        "encoded_size": len(encoded),
+        "ratio": len(encoded) / len(data) if data else 0.0,
+        "bits_per_byte": 8 * len(encoded) / len(data) if data else 0.0,
+        "encode_seconds": encode_time,
+        "decode_seconds": decode_time,
+        "encode_mb_per_s": megabytes / encode_time,
+        "decode_mb_per_s": megabytes / decode_time,
+        "encode_peak_bytes": peak_memory(lambda: encode(data)),
+        "decode_peak_bytes": peak_memory(lambda: decode(encoded, len(data))),
+    }
+    if collect_metrics:
+        # Kept out of the timed runs so it cannot skew them
+        with metrics.collect():
+            decode(encode(data), len(data))
+            result["metrics"] = metrics.snapshot()
+    return result
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(engines: List[str], corpora: Dict[str, bytes],
+              repeats: int = 3, seed: Optional[int] = None,
+              progress: bool = False,
+              collect_metrics: bool = False) -> Dict[str, Any]:
+    results = []
+    for name, data in corpora.items():
+        for engine in engines:
+            result = benchmark_engine(engine, name, data, repeats,
+                                      collect_metrics)
+            results.append(result)
+            if progress:
+                print(format_result(result), file=sys.stderr)
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "repeats": repeats,
+        "results": results,
+    }
+
+
+def generate_corpora(names: List[str], sizes: List[int],
+                     seed: int) -> Dict[str, bytes]:
+    return {f"{name}-{size}": CORPORA[name](size, seed)
+            for name in names for size in sizes}
+
+
+def load_corpora(paths: List[str]) -> Dict[str, bytes]:
+    corpora = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            corpora[os.path.basename(path)] = f.read()
+    return corpora
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    peak = max(result["encode_peak_bytes"], result["decode_peak_bytes"])
+    return (f"{result['engine']:>10} {result['corpus']:>18} "
+            f"ratio {result['ratio']:6.3f}  "
+            f"enc {result['encode_mb_per_s']:7.3f} MB/s  "
+            f"dec {result['decode_mb_per_s']:7.3f} MB/s  "
+            f"peak {peak / 1e6:7.2f} MB")
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """One line per engine/corpus pair found in both runs, with the change
+    in ratio and speed relative to the baseline.
+    """
+    before = {(r["engine"], r["corpus"]): r for r in baseline["results"]}
+    lines = []
+    for result in current["results"]:
+        old = before.get((result["engine"], result["corpus"]))
+        if old is None:
+            continue
+        encode = result["encode_mb_per_s"] / old["encode_mb_per_s"] - 1
+        decode = result["decode_mb_per_s"] / old["decode_mb_per_s"] - 1
+        lines.append(
+            f"{result['engine']:>10} {result['corpus']:>18} "
+            f"ratio {result['ratio'] - old['ratio']:+7.3f}  "
+            f"enc {encode:+7.1%}  dec {decode:+7.1%}")
+    return lines
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="benchmark.py",
+        description="Measure ratio, throughput and peak memory of every "
+                    "engine on generated or given corpora.")
+    parser.add_argument("files", nargs="*",
+                        help="benchmark these files instead of generated "
+                             "corpora")
+    parser.add_argument("-e", "--engines", nargs="+", choices=sorted(ENGINES),
+                        default=list(ENGINES))
+    parser.add_argument("-c", "--corpora", nargs="+", choices=sorted(CORPORA),
+                        default=list(CORPORA))
+    parser.add_argument("-s", "--sizes", nargs="+", type=int,
+                        default=list(DEFAULT_SIZES),
+                        help="bytes per generated corpus")
+    parser.add_argument("-r", "--repeats", type=int, default=3,
+                        help="timing runs per measurement, the best is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output",
+                        help="write the results as JSON to this file")
+    parser.add_argument("--baseline",
+                        help="JSON results of an earlier run to compare with")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record codec counters and stage timings in "
+                             "the results")
+    parser.add_argument("--find", action="store_true",
+                        help="only compare linear-scan and tree-descent "
+                             "symbol lookup in the decoder")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.find:
+        benchmark_decode(repeats=args.repeats, seed=args.seed)
+        return 0
+    if args.files:
+        corpora = load_corpora(args.files)
+    else:
+        corpora = generate_corpora(args.corpora, args.sizes, args.seed)
+    report = run_suite(args.engines, corpora, args.repeats,
+                       None if args.files else args.seed, progress=True,
+                       collect_metrics=args.metrics)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with {baseline.get('revision') or args.baseline}:")
+        for line in compare(baseline, report):
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
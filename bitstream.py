@@ -0,0 +1,144 @@
+from typing import Optional, Union
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class BitWriter:
+    """Packs variable-width unsigned integers, most significant bit first,
+    into a bytearray.
+    """
+
+    def __init__(self):
+        self.buffer: bytearray = bytearray()
+        self.accumulator: int = 0
+        self.count: int = 0
+        self.bit_length: int = 0
+
+    def __len__(self) -> int:
+        return self.bit_length
+
+    def write(self, value: int, width: int):
+        self.accumulator = (self.accumulator << width) | value
+        self.count += width
+        self.bit_length += width
+        if self.count >= 8:
+            nbytes = self.count >> 3
+            self.count &= 7
+            self.buffer += (self.accumulator >> self.count).to_bytes(
+                nbytes, "big")
+            self.accumulator &= (1 << self.count) - 1
+
+    def take(self) -> bytes:
+        """Remove and return the complete bytes written so far.
+
+        The bits of a trailing partial byte stay in the writer, so a stream
+        can be handed out piece by piece while it is being written.
+        """
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+    def getvalue(self) -> bytes:
+        """Bytes not yet taken, with the last byte padded with zeros."""
+        if self.count == 0:
+            return bytes(self.buffer)
+        tail = self.accumulator << (8 - self.count)
+        return bytes(self.buffer) + bytes((tail,))
+
+    def finish(self) -> bytes:
+        """Terminate the stream with a single 1 bit and zero padding.
+
+        The stop bit lets a reader recover the exact number of payload bits
+        from the bytes alone, see :func:`payload_bit_length`.
+        """
+        self.write(1, 1)
+        self.bit_length -= 1
+        return self.getvalue()
+
+
+def payload_bit_length(data: BytesLike) -> int:
+    """Number of bits before the stop bit of a terminated stream."""
+    data = memoryview(data)
+    end = len(data)
+    while end > 0 and data[end - 1] == 0:
+        end -= 1
+    if end == 0:
+        raise ValueError("Corrupted encoded data: missing stop bit.")
+    last = data[end - 1]
+    trailing = (last & -last).bit_length()
+    return end * 8 - trailing
+
+
+class BitReader:
+    """Reads variable-width unsigned integers back from bytes written by
+    :class:`BitWriter`.
+
+    With ``terminated=True`` the payload ends at the stop bit written by
+    :meth:`BitWriter.finish`. Otherwise the payload is the first
+    ``bit_length`` bits, or every bit of ``data`` if that is not given.
+    """
+
+    def __init__(self, data: BytesLike, terminated: bool = False,
+                 bit_length: Optional[int] = None):
+        self.data: memoryview = memoryview(data)
+        if terminated:
+            self.bit_length: int = payload_bit_length(self.data)
+        elif bit_length is not None:
+            self.bit_length = bit_length
+        else:
+            self.bit_length = len(self.data) * 8
+        self.position: int = 0
+
+    def __len__(self) -> int:
+        return self.bit_length
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.bit_length - self.position)
+
+    def read(self, width: int, pad: bool = False) -> int:
+        """Read ``width`` bits as an unsigned integer.
+
+        Reading past the end of the payload raises ``EOFError`` unless
+        ``pad`` is set, in which case the missing bits read as zeros.
+        """
+        available = self.remaining
+        if width > available:
+            if not pad:
+                raise EOFError("Unexpected end of bit stream.")
+            value = self.read(available) << (width - available)
+            self.position += width - available
+            return value
+        end = self.position + width
+        first = self.position >> 3
+        last = (end + 7) >> 3
+        chunk = int.from_bytes(self.data[first:last], "big")
+        self.position = end
+        return (chunk >> ((last << 3) - end)) & ((1 << width) - 1)
+
+    def read_bit(self) -> int:
+        """Read a single bit, zero past the end of the payload."""
+        position = self.position
+        self.position = position + 1
+        if position >= self.bit_length:
+            return 0
+        return (self.data[position >> 3] >> (7 - (position & 7))) & 1
+
+
+def to_bit_string(data: BytesLike) -> str:
+    """Render a terminated stream as a string of '0'/'1' characters."""
+    length = payload_bit_length(data)
+    if length == 0:
+        return ""
+    value = int.from_bytes(data, "big") >> (len(data) * 8 - length)
+    return format(value, "b").zfill(length)
+
+
+def from_bit_string(bits: str) -> bytes:
+    """Pack a string of '0'/'1' characters into a terminated stream."""
+    if bits.strip("01"):
+        raise ValueError("Bit string may only contain '0' and '1'.")
+    writer = BitWriter()
+    if bits:
+        writer.write(int(bits, 2), len(bits))
+    return writer.finish()
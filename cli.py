@@ -0,0 +1,207 @@
+import argparse
+import mmap
+import os
+import sys
+from contextlib import contextmanager
+from typing import IO, Iterator, List, Optional
+
+from container import DEFAULT_BLOCK_SIZE, CODECS, ContainerReader, ContainerWriter
+from lempel_ziv import (
+    DEFAULT_LEVEL, DEFAULT_MAX_MATCH, DEFAULT_WINDOW_SIZE, LZ_POLICIES, LZSS_LEVELS
+)
+from models import DEFAULT_ORDER, DEFAULT_SLOT_CAPACITY, DEFAULT_TABLE_SIZE
+from parallel import parallel_decode, parallel_encode
+from scheduler import AUTO_CODECS, DEFAULT_CANDIDATES, ScheduleReport
+
+# Headless entry point. Only the codec modules are imported here, never the
+# PyQt5 GUI, so this starts quickly on machines without a display.
+
+
+@contextmanager
+def open_input(path: str) -> Iterator[memoryview]:
+    """Yield the whole input as a memoryview.
+
+    Files are memory-mapped so blocks can be sliced out without copying;
+    stdin ("-") cannot be mapped and is read into memory instead.
+    """
+    if path == "-":
+        yield memoryview(sys.stdin.buffer.read())
+        return
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files cannot be mapped
+            yield memoryview(b"")
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            yield view
+        finally:
+            view.release()
+            try:
+                mapped.close()
+            except BufferError:
+                # A traceback still holds slices of the map; it is unmapped
+                # once they are collected
+                pass
+
+
+@contextmanager
+def open_output(path: str) -> Iterator[IO[bytes]]:
+    if path == "-":
+        yield sys.stdout.buffer
+        sys.stdout.buffer.flush()
+        return
+    with open(path, "wb") as f:
+        yield f
+
+
+def compress(data: memoryview, out: IO[bytes], codec: str, block_size: int,
+             workers: int, **params):
+    if workers > 1:
+        out.write(parallel_encode(data, codec, None, block_size, workers,
+                                  **params))
+        return
+    with ContainerWriter(out, codec, None, block_size, **params) as writer:
+        writer.write(data)
+
+
+def compress_stream(source: IO[bytes], out: IO[bytes], codec: str,
+                    block_size: int, **params):
+    # Pipes cannot be mapped, but they can be coded one block at a time
+    with ContainerWriter(out, codec, None, block_size, **params) as writer:
+        while True:
+            chunk = source.read(block_size)
+            if not chunk:
+                break
+            writer.write(chunk)
+
+
+def decompress(data: memoryview, out: IO[bytes], workers: int):
+    if workers > 1:
+        decoded = parallel_decode(data, workers)
+        out.write(decoded.encode("utf-8") if isinstance(decoded, str)
+                  else decoded)
+        return
+    reader = ContainerReader(data)
+    for block in reader.iter_blocks():
+        # Containers written from text hold text blocks
+        out.write(block.encode("utf-8") if isinstance(block, str) else block)
+
+
+def run_compress(args: argparse.Namespace, workers: int, params: dict):
+    if args.input == "-" and workers == 1:
+        with open_output(args.output) as out:
+            compress_stream(sys.stdin.buffer, out, args.codec,
+                            args.block_size, **params)
+    else:
+        with open_input(args.input) as data, \
+                open_output(args.output) as out:
+            compress(data, out, args.codec, args.block_size, workers,
+                     **params)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="cli.py",
+        description="Compress or decompress files with the adaptive "
+                    "arithmetic or Lempel-Ziv coder.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    comp = commands.add_parser("compress", help="compress a file")
+    comp.add_argument("input", nargs="?", default="-",
+                      help="file to compress (default: stdin)")
+    comp.add_argument("-o", "--output", default="-",
+                      help="where to write the container (default: stdout)")
+    comp.add_argument("-c", "--codec", choices=sorted(CODECS), default="lz")
+    comp.add_argument("-b", "--block-size", type=int,
+                      default=DEFAULT_BLOCK_SIZE,
+                      help="bytes per independently coded block")
+    comp.add_argument("-j", "--workers", type=int, default=1,
+                      help="worker processes (0 for one per core)")
+    comp.add_argument("--max-entries", type=int, default=None,
+                      help="LZ dictionary size limit")
+    comp.add_argument("--policy", choices=LZ_POLICIES, default="reset",
+                      help="what the LZ dictionary does when it is full")
+    comp.add_argument("-l", "--level", type=int, choices=sorted(LZSS_LEVELS),
+                      default=DEFAULT_LEVEL,
+                      help="LZSS match search effort, 1 (fast) to 9 (best)")
+    comp.add_argument("--window-size", type=int, default=DEFAULT_WINDOW_SIZE,
+                      help="LZSS sliding window size")
+    comp.add_argument("--max-match", type=int, default=DEFAULT_MAX_MATCH,
+                      help="LZSS longest match length")
+    comp.add_argument("--order", type=int, default=DEFAULT_ORDER,
+                      help="context model order")
+    comp.add_argument("--table-size", type=int, default=DEFAULT_TABLE_SIZE,
+                      help="most context model slots per order (bounds "
+                           "memory)")
+    comp.add_argument("--slot-capacity", type=int,
+                      default=DEFAULT_SLOT_CAPACITY,
+                      help="symbols kept per context model slot")
+    comp.add_argument("--candidates", nargs="+",
+                      choices=[c for c in AUTO_CODECS if c != "stored"],
+                      default=list(DEFAULT_CANDIDATES),
+                      help="codecs the auto codec chooses from per block")
+    comp.add_argument("--tolerance", type=float, default=0.0,
+                      help="auto codec: take the fastest candidate whose "
+                           "trial ratio is within this of the best")
+    comp.add_argument("--report", action="store_true",
+                      help="auto codec: print the choices made, with sizes "
+                           "and times, to stderr (codes in this process)")
+
+    decomp = commands.add_parser("decompress", help="decompress a file")
+    decomp.add_argument("input", nargs="?", default="-",
+                        help="container to decompress (default: stdin)")
+    decomp.add_argument("-o", "--output", default="-",
+                        help="where to write the data (default: stdout)")
+    decomp.add_argument("-j", "--workers", type=int, default=1,
+                        help="worker processes (0 for one per core)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    workers = args.workers or os.cpu_count() or 1
+    try:
+        if args.command == "compress":
+            params = {}
+            if args.codec in ("lz", "hybrid"):
+                params = {"max_entries": args.max_entries,
+                          "policy": args.policy}
+            elif args.codec == "lzss":
+                params = {"window_size": args.window_size,
+                          "max_match": args.max_match, "level": args.level}
+            elif args.codec == "context":
+                params = {"order": args.order, "table_size": args.table_size,
+                          "slot_capacity": args.slot_capacity}
+            elif args.codec == "auto":
+                # Every candidate reads its own settings from here
+                params = {"candidates": args.candidates,
+                          "tolerance": args.tolerance,
+                          "max_entries": args.max_entries,
+                          "policy": args.policy,
+                          "window_size": args.window_size,
+                          "max_match": args.max_match, "level": args.level,
+                          "order": args.order, "table_size": args.table_size,
+                          "slot_capacity": args.slot_capacity}
+            if args.report:
+                # Choices are only seen when blocks are coded here
+                report = ScheduleReport()
+                with report.collect():
+                    run_compress(args, 1, params)
+                for line in report.lines():
+                    print(line, file=sys.stderr)
+            else:
+                run_compress(args, workers, params)
+        else:
+            with open_input(args.input) as data, \
+                    open_output(args.output) as out:
+                decompress(data, out, workers)
+    except (OSError, ValueError) as e:
+        print(f"{args.command}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,417 @@
+import io
+import json
+import struct
+import zlib
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from arithmetic import (
+    ArithmeticDecoder, ArithmeticEncoder, model_arithmetic_decode,
+    model_arithmetic_encode
+)
+from bitstream import BytesLike
+from hybrid import hybrid_decode, hybrid_encode
+from lempel_ziv import (
+    DEFAULT_LEVEL, DEFAULT_MAX_MATCH, DEFAULT_WINDOW_SIZE, LZEncoder, lz_decode,
+    lz_decode_into, lzss_decode, lzss_encode, lzw_decode, lzw_encode
+)
+from instrumentation import metrics
+from models import (
+    DEFAULT_ORDER, DEFAULT_SLOT_CAPACITY, DEFAULT_TABLE_SIZE, ContextModel,
+    context_table_size
+)
+from scheduler import auto_decode, auto_encode, block_codec
+from utils import BYTE_ALPHABET
+
+# Layout of a container:
+#
+#   MAGIC | VERSION (u8) | header length (u32) | header (JSON)
+#   block 0 | block 1 | ...
+#   index: one BLOCK_ENTRY per block
+#   TRAILER: index offset (u64) | block count (u32) | index crc32 (u32) | END
+#
+# The header records the codec, its parameters and the alphabet. Every
+# block is coded independently, and the index at the end gives its offset,
+# size, symbol count and crc32, so any block can be located and verified
+# without touching the others.
+MAGIC = b"AALZ"
+END_MAGIC = b"ZLAA"
+VERSION = 1
+PREAMBLE = struct.Struct("<4sBI")
+BLOCK_ENTRY = struct.Struct("<QIQI")
+TRAILER = struct.Struct("<QII4s")
+DEFAULT_BLOCK_SIZE = 1 << 16
+
+
+class CorruptedBlockError(ValueError):
+    def __init__(self, index: int, message: str):
+        super().__init__(f"Corrupted block {index}: {message}")
+        self.index = index
+
+
+class BlockInfo(NamedTuple):
+    offset: int
+    size: int
+    length: int
+    crc32: int
+
+
+# An alphabet of None means byte mode: blocks are bytes-like slices of the
+# input and decode back to bytes.
+
+
+def _lz_stream(alphabet: Optional[list], params: Dict[str, Any]) -> LZEncoder:
+    return LZEncoder(alphabet, params.get("max_entries"),
+                     params.get("policy", "reset"))
+
+
+def _lz_encode_block(sequence, alphabet: Optional[list],
+                     params: Dict[str, Any]) -> bytes:
+    encoder = _lz_stream(alphabet, params)
+    return encoder.feed(sequence) + encoder.flush()
+
+
+def _lz_decode_block(payload: BytesLike, alphabet: Optional[list],
+                     length: int, params: Dict[str, Any]):
+    max_entries = params.get("max_entries")
+    policy = params.get("policy", "reset")
+    if alphabet is not None:
+        return lz_decode(payload, alphabet, max_entries, policy)
+    out = bytearray(length)
+    written = lz_decode_into(payload, None, out, max_entries, policy)
+    if written != length:
+        raise ValueError("Corrupted encoded data: block is too short.")
+    return out
+
+
+def _lzss_encode_block(sequence, alphabet: Optional[list],
+                       params: Dict[str, Any]) -> bytes:
+    return lzss_encode(sequence, alphabet,
+                       params.get("window_size", DEFAULT_WINDOW_SIZE),
+                       params.get("max_match", DEFAULT_MAX_MATCH),
+                       params.get("level", DEFAULT_LEVEL))
+
+
+def _lzss_decode_block(payload: BytesLike, alphabet: Optional[list],
+                       length: int, params: Dict[str, Any]):
+    return lzss_decode(payload, alphabet,
+                       params.get("window_size", DEFAULT_WINDOW_SIZE),
+                       params.get("max_match", DEFAULT_MAX_MATCH))
+
+
+def _lzw_encode_block(sequence, alphabet: Optional[list],
+                      params: Dict[str, Any]) -> bytes:
+    return lzw_encode(sequence, alphabet)
+
+
+def _lzw_decode_block(payload: BytesLike, alphabet: Optional[list],
+                      length: int, params: Dict[str, Any]):
+    return lzw_decode(payload, alphabet)
+
+
+def _hybrid_encode_block(sequence, alphabet: Optional[list],
+                         params: Dict[str, Any]) -> bytes:
+    return hybrid_encode(sequence, alphabet, params.get("max_entries"),
+                         params.get("policy", "reset"))
+
+
+def _hybrid_decode_block(payload: BytesLike, alphabet: Optional[list],
+                         length: int, params: Dict[str, Any]):
+    return hybrid_decode(payload, alphabet, params.get("max_entries"),
+                         params.get("policy", "reset"))
+
+
+def _arithmetic_stream(alphabet: Optional[list],
+                       params: Dict[str, Any]) -> ArithmeticEncoder:
+    # The model covers the whole alphabet, not just the block's symbols
+    return ArithmeticEncoder(alphabet)
+
+
+def _arithmetic_encode_block(sequence, alphabet: Optional[list],
+                             params: Dict[str, Any]) -> bytes:
+    encoder = _arithmetic_stream(alphabet, params)
+    return encoder.feed(sequence) + encoder.flush()
+
+
+def _arithmetic_decode_block(payload: BytesLike, alphabet: Optional[list],
+                             length: int, params: Dict[str, Any]):
+    decoder = ArithmeticDecoder(alphabet, length)
+    return decoder.feed(payload) + decoder.flush()
+
+
+def _context_model(alphabet: Optional[list], length: int,
+                   params: Dict[str, Any]) -> ContextModel:
+    # "table_size" is the most slots per order; a short block gets fewer
+    size = len(BYTE_ALPHABET if alphabet is None else alphabet)
+    table_size = context_table_size(
+        length, params.get("table_size", DEFAULT_TABLE_SIZE))
+    return ContextModel(size, params.get("order", DEFAULT_ORDER), table_size,
+                        slot_capacity=params.get("slot_capacity",
+                                                 DEFAULT_SLOT_CAPACITY))
+
+
+def _context_encode_block(sequence, alphabet: Optional[list],
+                          params: Dict[str, Any]) -> bytes:
+    model = _context_model(alphabet, len(sequence), params)
+    return model_arithmetic_encode(sequence, alphabet, model)
+
+
+def _context_decode_block(payload: BytesLike, alphabet: Optional[list],
+                          length: int, params: Dict[str, Any]):
+    model = _context_model(alphabet, length, params)
+    return model_arithmetic_decode(payload, alphabet, length, model)
+
+
+# "auto" picks one of the others (or stores the block) for every block,
+# see scheduler.py; the choice is the payload's first byte
+
+
+def _auto_encode_block(sequence, alphabet: Optional[list],
+                       params: Dict[str, Any]) -> bytes:
+    payload, choice = auto_encode(CODECS, sequence, alphabet, params,
+                                  STREAM_ENCODERS)
+    if metrics.enabled:
+        metrics.count(f"auto.{choice.codec}")
+        metrics.trace("auto.block", choice=choice)
+    return payload
+
+
+def _auto_decode_block(payload: BytesLike, alphabet: Optional[list],
+                       length: int, params: Dict[str, Any]):
+    return auto_decode(CODECS, payload, alphabet, length, params)
+
+
+CODECS: Dict[str, Tuple[Callable, Callable]] = {
+    "lz": (_lz_encode_block, _lz_decode_block),
+    "lzss": (_lzss_encode_block, _lzss_decode_block),
+    "lzw": (_lzw_encode_block, _lzw_decode_block),
+    "arithmetic": (_arithmetic_encode_block, _arithmetic_decode_block),
+    "hybrid": (_hybrid_encode_block, _hybrid_decode_block),
+    "context": (_context_encode_block, _context_decode_block),
+    "auto": (_auto_encode_block, _auto_decode_block),
+}
+
+# Codecs whose encoder can be fed a block piece by piece, with the same
+# output as coding it whole. The scheduler tries these on a prefix without
+# coding it twice, and keeps going with the winner's encoder.
+STREAM_ENCODERS: Dict[str, Callable] = {
+    "lz": _lz_stream,
+    "arithmetic": _arithmetic_stream,
+}
+
+
+def encode_block(codec: str, sequence, alphabet: Optional[list],
+                 params: Dict[str, Any]) -> bytes:
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec: {codec!r}")
+    return CODECS[codec][0](sequence, alphabet, params)
+
+
+def decode_block(codec: str, payload: BytesLike, alphabet: Optional[list],
+                 length: int, params: Dict[str, Any]):
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec: {codec!r}")
+    return CODECS[codec][1](payload, alphabet, length, params)
+
+
+class ContainerWriter:
+    """Writes a container to the binary file `raw`, one block at a time.
+
+    Data passed to `write` is buffered until a whole block of `block_size`
+    symbols is available; `close` codes the last partial block and appends
+    the block index. `raw` is left open. With `alphabet=None` the writer
+    takes bytes-like data, and whole blocks are sliced out of it without
+    copying.
+    """
+
+    def __init__(self, raw: IO[bytes], codec: str, alphabet: Optional[list],
+                 block_size: int = DEFAULT_BLOCK_SIZE, **params):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec: {codec!r}")
+        if block_size < 1:
+            raise ValueError("Block size must be a positive integer.")
+        self.raw = raw
+        self.codec = codec
+        self.alphabet = None if alphabet is None else list(alphabet)
+        self.block_size = block_size
+        self.params = params
+        self.blocks: List[BlockInfo] = []
+        self.pending: list = []
+        self.pending_length: int = 0
+        self.closed: bool = False
+        header = json.dumps({
+            "codec": codec,
+            "alphabet": self.alphabet,
+            "block_size": block_size,
+            "params": params,
+        }).encode("utf-8")
+        self.offset = 0
+        self._write_raw(PREAMBLE.pack(MAGIC, VERSION, len(header)) + header)
+
+    def _write_raw(self, data: bytes):
+        self.raw.write(data)
+        self.offset += len(data)
+
+    def _write_block(self, sequence):
+        payload = encode_block(self.codec, sequence, self.alphabet,
+                               self.params)
+        self._append(payload, len(sequence))
+
+    def _append(self, payload: bytes, length: int):
+        self.blocks.append(BlockInfo(self.offset, len(payload), length,
+                                     zlib.crc32(payload)))
+        self._write_raw(payload)
+
+    def write_payload(self, payload: bytes, length: int):
+        """Append a block that was already coded with this writer's codec,
+        alphabet and parameters, e.g. by a worker process.
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed writer.")
+        if self.pending_length:
+            raise ValueError("Cannot append a block while text is buffered.")
+        self._append(payload, length)
+
+    def _join(self, pieces: list):
+        return "".join(pieces) if self.alphabet is not None \
+            else b"".join(pieces)
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed writer.")
+        size = len(data)
+        if self.alphabet is None:
+            data = memoryview(data).cast("B")
+            size = len(data)
+        if self.pending_length + size < self.block_size:
+            # Copy, the caller may reuse or unmap its buffer
+            self.pending.append(data if self.alphabet is not None
+                                else bytes(data))
+            self.pending_length += size
+            return size
+        if self.pending:
+            data = self._join(self.pending + [data])
+            self.pending = []
+        cut = len(data) - len(data) % self.block_size
+        for start in range(0, cut, self.block_size):
+            self._write_block(data[start:start + self.block_size])
+        rest = data[cut:]
+        self.pending = [rest if self.alphabet is not None else bytes(rest)] \
+            if len(rest) else []
+        self.pending_length = len(rest)
+        return size
+
+    def close(self):
+        if self.closed:
+            return
+        if self.pending_length:
+            self._write_block(self._join(self.pending))
+            self.pending = []
+            self.pending_length = 0
+        index = b"".join(BLOCK_ENTRY.pack(*block) for block in self.blocks)
+        index_offset = self.offset
+        self._write_raw(index)
+        self._write_raw(TRAILER.pack(index_offset, len(self.blocks),
+                                     zlib.crc32(index), END_MAGIC))
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ContainerReader:
+    """Random access to the blocks of a container held in memory.
+
+    `data` may be any bytes-like object, including a memoryview over a
+    memory-mapped file; blocks are sliced out of it without copying.
+    """
+
+    def __init__(self, data: BytesLike):
+        self.data = memoryview(data)
+        if len(self.data) < PREAMBLE.size + TRAILER.size:
+            raise ValueError("Corrupted encoded data: container too short.")
+        magic, version, header_length = PREAMBLE.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError("Not a container: bad magic number.")
+        if version != VERSION:
+            raise ValueError(f"Unsupported container version {version}.")
+        start = PREAMBLE.size
+        header = json.loads(bytes(self.data[start:start + header_length]))
+        self.codec: str = header["codec"]
+        self.alphabet: Optional[list] = header["alphabet"]
+        self.block_size: int = header["block_size"]
+        self.params: Dict[str, Any] = header["params"]
+
+        index_offset, count, index_crc, end_magic = TRAILER.unpack_from(
+            self.data, len(self.data) - TRAILER.size)
+        if end_magic != END_MAGIC:
+            raise ValueError("Corrupted encoded data: bad container trailer.")
+        index = self.data[index_offset:index_offset + count * BLOCK_ENTRY.size]
+        if len(index) != count * BLOCK_ENTRY.size or \
+                zlib.crc32(index) != index_crc:
+            raise ValueError("Corrupted encoded data: bad block index.")
+        self.blocks: List[BlockInfo] = [
+            BlockInfo(*entry) for entry in BLOCK_ENTRY.iter_unpack(index)]
+
+    def __len__(self) -> int:
+        """Number of symbols in the original sequence."""
+        return sum(block.length for block in self.blocks)
+
+    def payload(self, index: int) -> memoryview:
+        block = self.blocks[index]
+        payload = self.data[block.offset:block.offset + block.size]
+        if len(payload) != block.size or zlib.crc32(payload) != block.crc32:
+            raise CorruptedBlockError(index, "checksum mismatch.")
+        return payload
+
+    def read_block(self, index: int):
+        payload = self.payload(index)
+        try:
+            decoded = decode_block(self.codec, payload, self.alphabet,
+                                   self.blocks[index].length, self.params)
+        except (ValueError, IndexError) as e:
+            raise CorruptedBlockError(index, str(e)) from e
+        return self.check_block(index, decoded)
+
+    def block_codec(self, index: int) -> str:
+        """The codec block `index` was coded with; for "auto" containers
+        this is the one the scheduler picked for it.
+        """
+        if self.codec != "auto":
+            return self.codec
+        return block_codec(self.payload(index))
+
+    def check_block(self, index: int, decoded):
+        if len(decoded) != self.blocks[index].length:
+            raise CorruptedBlockError(index, "wrong decoded length.")
+        return decoded
+
+    def iter_blocks(self) -> Iterator:
+        for index in range(len(self.blocks)):
+            yield self.read_block(index)
+
+    def join(self, blocks: Iterable):
+        """Concatenate decoded blocks into text, or bytes in byte mode."""
+        return "".join(blocks) if self.alphabet is not None \
+            else b"".join(blocks)
+
+    def read(self):
+        return self.join(self.iter_blocks())
+
+
+def write_container(sequence, codec: str = "lz",
+                    alphabet: Optional[list] = None,
+                    block_size: int = DEFAULT_BLOCK_SIZE, **params) -> bytes:
+    # Text gets the alphabet of its own symbols, anything else is bytes
+    if alphabet is None and isinstance(sequence, str):
+        alphabet = sorted(list(set(sequence)))
+    raw = io.BytesIO()
+    with ContainerWriter(raw, codec, alphabet, block_size, **params) as writer:
+        writer.write(sequence)
+    return raw.getvalue()
+
+
+def read_container(data: BytesLike):
+    return ContainerReader(data).read()
@@ -0,0 +1,131 @@
+from typing import Any, Dict, Optional
+
+from arithmetic import STATE_BITS, SymbolDecoder, SymbolEncoder
+from instrumentation import metrics
+from lempel_ziv import (
+    LZTokens, Tokens, Wordbook, as_tokens, lz_reconstruct_into,
+    lz_sequence_length, lz_thesaurus
+)
+from models import AdaptiveModel
+from utils import decode_symbols, resolve_alphabet, symbol_buffer
+
+# LZ78 tokens coded with adaptive arithmetic models instead of fixed-width
+# integers. Each index is split into a bucket, its bit length, which goes
+# through an adaptive model, and the bits below its leading 1, which are
+# sent raw. The symbol after a word is coded with a model picked by the
+# word's own last symbol. Both sides replay the wordbook to know it. The
+# bucket models have one extra entry that marks the end of the stream.
+INDEX_BUCKETS = 33
+END_OF_STREAM = INDEX_BUCKETS
+# Counts grow by more than 1 so the models follow the data quickly
+MODEL_INCREMENT = 32
+
+
+class LZTokenModels:
+    """The adaptive models the encoder and decoder keep in step.
+
+    Bucket models are chosen by the bit length of the wordbook size, which
+    bounds the bucket, and symbol models by the last symbol of the word
+    being extended. Both are created on first use.
+    """
+
+    def __init__(self, alphabet_size: int):
+        self.alphabet_size = alphabet_size
+        self.bucket_models: Dict[int, AdaptiveModel] = {}
+        self.symbol_models: Dict[Any, AdaptiveModel] = {}
+
+    def buckets(self, size: int) -> AdaptiveModel:
+        context = size.bit_length()
+        model = self.bucket_models.get(context)
+        if model is None:
+            model = self.bucket_models[context] = AdaptiveModel(
+                INDEX_BUCKETS + 1, increment=MODEL_INCREMENT)
+        return model
+
+    def symbols(self, previous) -> AdaptiveModel:
+        model = self.symbol_models.get(previous)
+        if model is None:
+            model = self.symbol_models[previous] = AdaptiveModel(
+                self.alphabet_size, increment=MODEL_INCREMENT)
+        return model
+
+
+def last_symbol(wordbook: Wordbook, index: int) -> Optional[int]:
+    """Alphabet index of the last symbol of entry `index`, None for the
+    empty word."""
+    return wordbook.symbols[index] if index else None
+
+
+@metrics.timed("hybrid.pack")
+def hybrid_pack_thesaurus(tokens: Tokens,
+                          alphabet: Optional[list] = None,
+                          max_entries: Optional[int] = None,
+                          policy: str = "reset") -> bytes:
+    # Symbol indices in `tokens` refer to its own alphabet
+    tokens = as_tokens(tokens, alphabet)
+    if alphabet is None:
+        alphabet = tokens.alphabet
+    models = LZTokenModels(len(alphabet))
+    wordbook = Wordbook(max_entries, policy, track_children=False,
+                        alphabet=alphabet)
+    encoder = SymbolEncoder()
+    for index, symbol_index in zip(tokens.indices, tokens.symbols):
+        bucket = index.bit_length()
+        encoder.encode(models.buckets(len(wordbook)), bucket)
+        if bucket > 1:
+            encoder.encode_bits(index - (1 << (bucket - 1)), bucket - 1)
+        encoder.encode(models.symbols(last_symbol(wordbook, index)),
+                       symbol_index)
+        wordbook.add(index, symbol_index)
+    encoder.encode(models.buckets(len(wordbook)), END_OF_STREAM)
+    if metrics.enabled:
+        metrics.count("hybrid.tokens", len(tokens))
+        metrics.count("hybrid.bits", len(encoder.writer) + 1)
+    return encoder.finish()
+
+
+@metrics.timed("hybrid.unpack")
+def hybrid_unpack_thesaurus(encoded: bytes, alphabet: Optional[list] = None,
+                            max_entries: Optional[int] = None,
+                            policy: str = "reset") -> LZTokens:
+    tokens = LZTokens(alphabet)
+    alphabet = tokens.alphabet
+    models = LZTokenModels(len(alphabet))
+    wordbook = Wordbook(max_entries, policy, track_children=False,
+                        alphabet=alphabet)
+    decoder = SymbolDecoder(encoded)
+    reader = decoder.reader
+    while True:
+        bucket = decoder.decode(models.buckets(len(wordbook)))
+        if bucket == END_OF_STREAM:
+            return tokens
+        index = bucket
+        if bucket > 1:
+            index = (1 << (bucket - 1)) + decoder.decode_bits(bucket - 1)
+        if index >= len(wordbook):
+            raise ValueError(
+                "Corrupted encoded data: dictionary index out of range.")
+        model = models.symbols(last_symbol(wordbook, index))
+        symbol_index = decoder.decode(model)
+        tokens.append(index, symbol_index)
+        wordbook.add(index, symbol_index)
+        if reader.position > reader.bit_length + 2 * STATE_BITS:
+            # A real stream reaches its end marker long before this
+            raise ValueError("Corrupted encoded data: missing end of stream.")
+
+
+def hybrid_encode(sequence: str, alphabet: Optional[list] = None,
+                  max_entries: Optional[int] = None,
+                  policy: str = "reset") -> bytes:
+    alphabet = resolve_alphabet(sequence, alphabet)
+    tokens = lz_thesaurus(sequence, max_entries, policy, alphabet=alphabet)
+    return hybrid_pack_thesaurus(tokens, alphabet, max_entries, policy)
+
+
+def hybrid_decode(encoded: bytes, alphabet: Optional[list] = None,
+                  max_entries: Optional[int] = None, policy: str = "reset"):
+    tokens = hybrid_unpack_thesaurus(encoded, alphabet, max_entries, policy)
+    sequence = symbol_buffer(alphabet, lz_sequence_length(
+        tokens, max_entries, policy))
+    lz_reconstruct_into(tokens, sequence, max_entries, policy)
+    return decode_symbols(sequence, alphabet)
@@ -0,0 +1,113 @@
+import functools
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+
+# Codecs report what they did through the shared `metrics` object. While it
+# is disabled (the default) every hook is skipped behind a single attribute
+# check per call, never per symbol, so there is nothing to pay for it. Hot
+# loops keep no counters of their own; totals are worked out from the
+# results once the loop is done.
+
+TraceCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class Instrumentation:
+    """Counters, gauges, per-stage timers and trace callbacks.
+
+    Counters add up over every call, gauges keep the last value reported
+    and timers keep the total time and number of calls of each stage.
+    Callbacks passed to `subscribe` get every trace event as
+    ``callback(event, fields)``; stage timings arrive as ``"stage"`` events.
+    """
+
+    def __init__(self):
+        self.enabled: bool = False
+        self.counters: Counter = Counter()
+        self.gauges: Dict[str, Any] = {}
+        self.seconds: Counter = Counter()
+        self.calls: Counter = Counter()
+        self.subscribers: List[TraceCallback] = []
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.counters.clear()
+        self.gauges.clear()
+        self.seconds.clear()
+        self.calls.clear()
+
+    @contextmanager
+    def collect(self) -> Iterator["Instrumentation"]:
+        """Enable collection from a clean slate for the `with` block."""
+        was_enabled = self.enabled
+        self.reset()
+        self.enable()
+        try:
+            yield self
+        finally:
+            self.enabled = was_enabled
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def gauge(self, name: str, value: Any):
+        self.gauges[name] = value
+
+    def subscribe(self, callback: TraceCallback) -> TraceCallback:
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback: TraceCallback):
+        self.subscribers.remove(callback)
+
+    def trace(self, event: str, **fields):
+        for callback in self.subscribers:
+            callback(event, fields)
+
+    def timed(self, name: str) -> Callable:
+        """Decorator recording the time spent in a stage."""
+        def decorate(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    self.seconds[name] += elapsed
+                    self.calls[name] += 1
+                    if self.subscribers:
+                        self.trace("stage", name=name, seconds=elapsed)
+            return wrapper
+        return decorate
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "timers": {name: {"calls": self.calls[name],
+                              "seconds": self.seconds[name]}
+                       for name in self.seconds},
+        }
+
+
+metrics = Instrumentation()
+
+
+def log_events(logger: logging.Logger = logging.getLogger("codecs"),
+               level: int = logging.DEBUG) -> TraceCallback:
+    """Subscribe `logger` to every trace event; returns the callback so it
+    can be unsubscribed again.
+    """
+    def callback(event: str, fields: Dict[str, Any]):
+        logger.log(level, "%s %s", event, fields)
+    return metrics.subscribe(callback)
@@ -1,171 +1,997 @@
+from array import array
 from math import ceil, log2
-from typing import Dict, List, Tuple
-from utils import window_match, symbol_to_binary, integer_decimal_to_binary, binary_to_integer_decimal, \
-    calculate_efficiency
+from collections import OrderedDict
+from typing import (
+    Any, Dict, Iterator, List, MutableSequence, Optional, Tuple, Union
+)
+from bitstream import BitReader, BitWriter, payload_bit_length, to_bit_string
+from instrumentation import metrics
+from results import EncodeResult, ResultCache, encode_with_stats
+from utils import (
+    BYTE_ALPHABET, byte_view, decode_symbols, is_byte_data, resolve_alphabet,
+    symbol_buffer
+)
 
 import logging
 
 # logging.basicConfig(level=logging.DEBUG, format='%(levelname)s - %(message)s')
 
 
-def lz_thesaurus(sequence: str) -> List[Tuple[int, str]]:
+LZ_POLICIES = ("reset", "freeze", "lru")
+
+
+def symbol_array(alphabet) -> MutableSequence:
+    """An empty array for alphabet indices: a bytearray when they fit in a
+    byte, 32-bit unsigned ints otherwise."""
+    return bytearray() if len(alphabet) <= 256 else array('I')
+
+
+class Wordbook:
+    """LZ78 dictionary shared by the parser and the decoder.
+
+    Entry 0 is the empty word and every other entry extends its parent
+    entry by one symbol, so only the parent index, last symbol and length
+    of each entry are stored, in arrays. Symbols are kept as indices into
+    `alphabet` (byte values when it is None) and entries are added by
+    symbol index. With `max_entries` set, `policy` decides what
+    happens when the wordbook is full: "reset" drops back to the empty
+    word, "freeze" stops adding entries and "lru" reuses the slot of the
+    least recently used leaf. Both sides apply the same rule on every
+    token, so they stay in sync without sending anything extra.
+
+    A `preset` (see presets.py) starts the wordbook from trained entries
+    instead of the empty word alone. They are never evicted, and a reset
+    goes back to them.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None,
+                 policy: str = "reset", track_children: bool = True,
+                 preset=None, alphabet: Optional[list] = None):
+        if policy not in LZ_POLICIES:
+            raise ValueError(f"Unknown dictionary policy: {policy!r}")
+        if max_entries is not None and max_entries < 2:
+            raise ValueError("Dictionary needs room for at least two entries.")
+        self.max_entries = max_entries
+        self.policy = policy
+        self.preset = preset
+        self.alphabet = BYTE_ALPHABET if alphabet is None else alphabet
+        if preset is None:
+            self.base = 1
+            self.parents = array('I', [0])
+            self.lengths = array('I', [0])
+            # Entry 0 has no symbol; its slot is never read
+            self.symbols = symbol_array(self.alphabet)
+            self.symbols.append(0)
+            self.child_counts = array('I', [0])
+        else:
+            self.base = len(preset)
+            if max_entries is not None and self.base >= max_entries:
+                raise ValueError("Preset dictionary does not leave room in "
+                                 "max_entries.")
+            # The preset is shared, so the wordbook works on copies
+            self.parents = preset.parents[:]
+            self.lengths = preset.lengths[:]
+            self.symbols = preset.symbol_indices[:]
+            self.child_counts = preset.child_counts[:]
+        # The parser needs the trie edges, the decoder does not
+        self.children: Optional[Dict[Tuple[int, Any], int]] = None
+        if track_children:
+            self.children = {} if preset is None else preset.children.copy()
+        # Leaves in least to most recently used order, for the lru policy
+        self.leaves: "OrderedDict[int, None]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def reset(self):
+        # Callers hold on to these containers, so they are cut in place
+        base = self.base
+        del self.parents[base:]
+        del self.lengths[base:]
+        del self.symbols[base:]
+        del self.child_counts[base:]
+        self.leaves.clear()
+        if self.preset is None:
+            self.child_counts[0] = 0
+            if self.children is not None:
+                self.children.clear()
+        else:
+            self.child_counts[:] = self.preset.child_counts
+            if self.children is not None:
+                self.children.clear()
+                self.children.update(self.preset.children)
+
+    def add(self, parent: int, symbol_index: int):
+        size = len(self.parents)
+        if self.max_entries is None or size < self.max_entries:
+            slot = size
+            self.parents.append(parent)
+            self.lengths.append(self.lengths[parent] + 1)
+            self.symbols.append(symbol_index)
+            self.child_counts.append(0)
+        elif self.policy == "reset":
+            self.reset()
+            return
+        elif self.policy == "freeze":
+            return
+        else:
+            slot = self._evict(parent)
+            if slot is None:
+                return
+            self.parents[slot] = parent
+            self.lengths[slot] = self.lengths[parent] + 1
+            self.symbols[slot] = symbol_index
+        if self.children is not None:
+            self.children[(parent, self.alphabet[symbol_index])] = slot
+        if self.policy == "lru":
+            self.child_counts[parent] += 1
+            self.leaves.pop(parent, None)
+            self.leaves[slot] = None
+
+    def _evict(self, keep: int) -> Optional[int]:
+        victim = next((leaf for leaf in self.leaves if leaf != keep), None)
+        if victim is None:
+            return None
+        del self.leaves[victim]
+        parent = self.parents[victim]
+        self.child_counts[parent] -= 1
+        if parent >= self.base and self.child_counts[parent] == 0:
+            self.leaves[parent] = None
+        if self.children is not None:
+            del self.children[(parent, self.alphabet[self.symbols[victim]])]
+        return victim
+
+    def next_size(self, size: int) -> int:
+        """Wordbook size after one more token, given the size before it."""
+        if self.max_entries is None or size < self.max_entries:
+            return size + 1
+        return self.base if self.policy == "reset" else size
+
+
+class LZTokens:
+    """LZ78 tokens as two parallel arrays instead of a list of tuples.
+
+    `indices` holds the wordbook index of every token and `symbols` the
+    alphabet index of the symbol after it, in a bytearray when the alphabet
+    fits in a byte. A token costs five bytes rather than a tuple and its
+    items. Iterating yields ``(index, symbol)`` pairs with the alphabet
+    symbols themselves. `alphabet=None` means byte values.
+    """
+
+    __slots__ = ("alphabet", "indices", "symbols")
+
+    def __init__(self, alphabet: Optional[list] = None):
+        if alphabet is None:
+            alphabet = BYTE_ALPHABET
+        self.alphabet = alphabet
+        self.indices = array('I')
+        self.symbols = symbol_array(alphabet)
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __iter__(self) -> Iterator[Tuple[int, Any]]:
+        alphabet = self.alphabet
+        for index, symbol_index in zip(self.indices, self.symbols):
+            yield index, alphabet[symbol_index]
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return list(self)[item]
+        return self.indices[item], self.alphabet[self.symbols[item]]
+
+    def __eq__(self, other) -> bool:
+        # Equal to other tokens or to a list of the same (index, symbol)
+        # pairs, so code written for the old thesaurus lists still works
+        if isinstance(other, (LZTokens, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def append(self, index: int, symbol_index: int):
+        self.indices.append(index)
+        self.symbols.append(symbol_index)
+
+    @classmethod
+    def from_pairs(cls, pairs, alphabet: Optional[list] = None) -> "LZTokens":
+        """Tokens from a list of ``(index, symbol)`` pairs.
+
+        Without an alphabet, int symbols are taken as byte values and any
+        other symbols as the sorted set of those present.
+        """
+        pairs = list(pairs)
+        if alphabet is None and any(
+                not isinstance(symbol, int) for _, symbol in pairs):
+            alphabet = sorted({symbol for _, symbol in pairs})
+        tokens = cls(alphabet)
+        alphabet_map = symbol_index_map(tokens.alphabet)
+        for index, symbol in pairs:
+            tokens.append(index, alphabet_map[symbol])
+        return tokens
+
+
+# What the token stages accept: an LZTokens or (index, symbol) pairs
+Tokens = Union[LZTokens, List[Tuple[int, Any]]]
+
+
+def as_tokens(tokens: Tokens, alphabet: Optional[list] = None) -> LZTokens:
+    """`tokens` itself, or an `LZTokens` built from ``(index, symbol)``
+    pairs."""
+    if isinstance(tokens, LZTokens):
+        return tokens
+    return LZTokens.from_pairs(tokens, alphabet)
+
+
+@metrics.timed("lz.parse")
+def lz_thesaurus(sequence: str, max_entries: Optional[int] = None,
+                 policy: str = "reset", preset=None,
+                 alphabet: Optional[list] = None) -> LZTokens:
     # Using terminology from the english literature cause it makes more sense
     # this way as i don't know the formal name of the lists we create
-    wordbook: List[str] = [""]
-    thesaurus: List[Tuple[int, str]] = []
-    i: int = 0
-
-    while i < len(sequence):
-        synonym, index = window_match(sequence[i:], wordbook)
-        window = len(synonym)
-        word = sequence[i + window:i + window + 1]
-        if word == '':
-            # Only one symbol left, send it as is
-            thesaurus.append((0, sequence[i:]))
-            logging.debug(f"[THESAURUS] Matched last symbol: '{sequence[i:]}' at index 0")
-            break
-        reference = sequence[i:i + window + 1]
-        logging.debug(f"[THESAURUS] Matched synonym: '{synonym}' at index {index}, next word: '{word}'")
-        thesaurus.append((index, word))
-        wordbook.append(reference)
-        i += window + 1
-    logging.info(f"[THESAURUS] Final thesaurus:{thesaurus}")
-    return thesaurus
-
-
-def lz_pack_thesaurus(dictionary: List[Tuple[int, str]],
-                      alphabet: list) -> str:
-    index_bits = ceil(log2(len(alphabet)))
-
-    alphabet_map: Dict[str, str] = {
-        sigma: symbol_to_binary(sigma, index_bits, i)
-        for i, sigma in enumerate(alphabet)
-    }
-    logging.debug(f"[PACK] Alphabet map: {alphabet_map}")
-
-    xy_pairs = [
-        (integer_decimal_to_binary(index), alphabet_map[symbol])
-        for index, symbol in dictionary
-    ]
-    logging.debug(f"[PACK] XY pairs: {xy_pairs}")
-
-    # for a = 2^(index_bits)
-    a = 2 ** (index_bits)
-    logging.debug(f"[PACK] Value of a: {a}")
-
-    xy_mapped = [
-        a * binary_to_integer_decimal(index_bin) +
-        binary_to_integer_decimal(symbol_bin)
-        for index_bin, symbol_bin in xy_pairs
-    ]
-    logging.debug(f"[PACK] XY mapped values: {xy_mapped}")
-
-    # FIX: The max value is determined by the maximum possible dictionary index at that step
-    # AND the maximum possible symbol value.
-    # Max value = (Current Dictionary Size) * a + (Max Symbol Value)
-    max_xy_mapped = [a * i + (a - 1) for i in range(len(xy_mapped))]
-
-    logging.debug(f"[PACK] Max XY mapped values: {max_xy_mapped}")
-
-    no_of_bits = [ceil(log2(val + 1)) for val in max_xy_mapped]
-    logging.debug(f"[PACK] Number of bits for each pair: {no_of_bits}")
-
-    binary_encoded = [
-        integer_decimal_to_binary(xy).zfill(bits)
-        for xy, bits in zip(xy_mapped, no_of_bits)
-    ]
-    logging.info(f"Binary encoded segments: {binary_encoded}")
-
-    return "".join(binary_encoded)
-
-
-def lz_unpack_thesaurus(encoded: str, alphabet: list) -> List[Tuple[int, str]]:
-    index_bits = ceil(log2(len(alphabet)))
-    a = 2 ** (index_bits)
-
-    dictionary: List[Tuple[int, str]] = []
-    i = 0
-
-    logging.debug(f"Starting UNPACK | encoded length = {len(encoded)} bits")
-    logging.debug(f"Alphabet: {alphabet} | index_bits={index_bits} | a={a}")
-
-    while i < len(encoded):
-        # FIX: Calculate bits required based on current dictionary size
-        # This matches the logic in lz_pack_thesaurus
-        max_val = a * len(dictionary) + (a - 1)
-        bits = ceil(log2(max_val + 1))
-
-        segment = encoded[i:i + bits]
+    # The wordbook is a trie: entry 0 is the empty word and every other entry
+    # is reached from its parent entry by one symbol.
+    # Bytes-like input is walked as byte values, never as 1-char strings.
+    # Text without an alphabet takes the symbols it contains.
+    if alphabet is None and not is_byte_data(sequence):
+        alphabet = sorted(set(sequence))
+    alphabet = resolve_alphabet(sequence, alphabet)
+    if is_byte_data(sequence):
+        sequence = byte_view(sequence)
+    wordbook = Wordbook(max_entries, policy, preset=preset, alphabet=alphabet)
+    children = wordbook.children
+    alphabet_map = symbol_index_map(alphabet)
+    tokens = LZTokens(alphabet)
+    add_index = tokens.indices.append
+    add_symbol = tokens.symbols.append
+    node: int = 0
+
+    for word in sequence:
+        child = children.get((node, word))
+        if child is not None:
+            node = child
+            continue
+        symbol_index = alphabet_map[word]
+        add_index(node)
+        add_symbol(symbol_index)
+        wordbook.add(node, symbol_index)
+        node = 0
+
+    if node != 0:
+        # The input ended inside a known word. Its prefix is in the wordbook
+        # too, so send the prefix index with the last symbol.
+        tokens.append(wordbook.parents[node], wordbook.symbols[node])
+    if metrics.enabled:
+        metrics.count("lz.symbols", len(sequence))
+        metrics.count("lz.tokens", len(tokens))
+        metrics.gauge("lz.dictionary_size", len(wordbook))
+        metrics.trace("lz.parse", symbols=len(sequence),
+                      tokens=len(tokens), dictionary_size=len(wordbook))
+    return tokens
+
+
+def symbol_bits(alphabet: list) -> int:
+    # A one-symbol alphabet still gets a bit per token, otherwise a stream
+    # holding only that symbol would pack to zero bits and decode to nothing
+    return max(1, ceil(log2(len(alphabet))))
+
+
+def symbol_index_map(alphabet):
+    if isinstance(alphabet, range) and alphabet.start == 0:
+        # Byte values are their own indices
+        return alphabet
+    return {sigma: i for i, sigma in enumerate(alphabet)}
+
+
+@metrics.timed("lz.pack")
+def lz_pack_thesaurus(tokens: Tokens, alphabet: Optional[list] = None,
+                      max_entries: Optional[int] = None,
+                      policy: str = "reset", preset=None) -> bytes:
+    # Symbol indices in `tokens` refer to its own alphabet. A list of
+    # (index, symbol) pairs is mapped through `alphabet` first.
+    tokens = as_tokens(tokens, alphabet)
+    if alphabet is None:
+        alphabet = tokens.alphabet
+    a = 2 ** symbol_bits(alphabet)
+
+    # A token is written as a * index + symbol index, as wide as the largest
+    # value possible at its step: the last wordbook entry with the last
+    # symbol, a * size - 1. The size is replayed token by token.
+    wordbook = Wordbook(max_entries, policy, track_children=False,
+                        preset=preset)
+    next_size = wordbook.next_size
+    size = len(wordbook)
+    writer = BitWriter()
+    write = writer.write
+    for index, symbol_index in zip(tokens.indices, tokens.symbols):
+        write(a * index + symbol_index, (a * size - 1).bit_length())
+        size = next_size(size)
+    if metrics.enabled:
+        metrics.count("lz.bits", len(writer))
+        metrics.trace("lz.pack", tokens=len(tokens), bits=len(writer))
+
+    return writer.finish()
+
+
+@metrics.timed("lz.unpack")
+def lz_unpack_thesaurus(encoded: bytes, alphabet: Optional[list] = None,
+                        max_entries: Optional[int] = None,
+                        policy: str = "reset", preset=None) -> LZTokens:
+    tokens = LZTokens(alphabet)
+    alphabet_size = len(tokens.alphabet)
+    index_bits = symbol_bits(tokens.alphabet)
+    a = 2 ** index_bits
+    add_index = tokens.indices.append
+    add_symbol = tokens.symbols.append
+
+    reader = BitReader(encoded, terminated=True)
+    wordbook = Wordbook(max_entries, policy, track_children=False,
+                        preset=preset)
+    next_size = wordbook.next_size
+    size = len(wordbook)
+
+    while reader.remaining:
+        # Same width as lz_pack_thesaurus gave the token at this step
+        bits = (a * size - 1).bit_length()
 
         # Guard against incomplete segments (optional safety)
-        if len(segment) < bits:
+        if reader.remaining < bits:
             logging.warning("Reached end of stream with incomplete segment.")
             break
 
-        xy_mapped = binary_to_integer_decimal(segment)
-
-        index = xy_mapped // a
-        symbol_index = xy_mapped % a
-
-        if symbol_index >= len(alphabet):
-            logging.debug(f"Symbol index {symbol_index} outside alphabet at offset {i}")
+        xy_mapped = reader.read(bits)
+        symbol_index = xy_mapped & (a - 1)
+        if symbol_index >= alphabet_size:
             raise ValueError(
                 "Corrupted encoded data: symbol index out of range.")
 
-        symbol = alphabet[symbol_index]
-
-        logging.debug(
-            f"[UNPACK] offset={i} bits={bits} seg='{segment}' xy_val={xy_mapped} "
-            f"-> index={index}, symbol='{symbol}' (symbol_index={symbol_index})"
-        )
-
-        dictionary.append((index, symbol))
-        i += bits
-
-    logging.debug(f"Final unpacked dictionary: {dictionary}")
-    return dictionary
-
-
-def lz_reconstruct_sequence(dictionary: List[Tuple[int, str]]) -> str:
-    wordbook: List[str] = [""]
-    sequence: str = ""
-
-    logging.debug(f"Starting RECONSTRUCT with dictionary: {dictionary}")
-
-    for step, (index, symbol) in enumerate(dictionary):
-        reference = wordbook[index] + symbol
-        sequence += reference
-        wordbook.append(reference)
-
-        logging.debug(
-            f"[RECONSTRUCT] step={step} index={index} symbol='{symbol}' "
-            f"reference='{reference}'"
-        )
-
-    logging.debug(f"[RECONSTRUCT] Final reconstructed sequence: '{sequence}'")
-    return sequence
-
-
-def lz_encode(sequence: str, alphabet: list) -> str:
-    dictionary = lz_thesaurus(sequence)
-    encoded = lz_pack_thesaurus(dictionary, alphabet)
+        add_index(xy_mapped >> index_bits)
+        add_symbol(symbol_index)
+        size = next_size(size)
+
+    if metrics.enabled:
+        metrics.count("lz.tokens_decoded", len(tokens))
+        metrics.trace("lz.unpack", bits=len(reader), tokens=len(tokens))
+    return tokens
+
+
+def lz_sequence_length(tokens: Tokens, max_entries: Optional[int] = None,
+                       policy: str = "reset", preset=None) -> int:
+    # Replays the wordbook to learn each word's length without writing it
+    tokens = as_tokens(tokens)
+    wordbook = Wordbook(max_entries, policy, track_children=False,
+                        preset=preset, alphabet=tokens.alphabet)
+    lengths = wordbook.lengths
+    total = 0
+    for index, symbol_index in zip(tokens.indices, tokens.symbols):
+        if index >= len(wordbook):
+            raise ValueError(
+                "Corrupted encoded data: dictionary index out of range.")
+        total += lengths[index] + 1
+        wordbook.add(index, symbol_index)
+    return total
+
+
+@metrics.timed("lz.reconstruct")
+def lz_reconstruct_into(tokens: Tokens, out: MutableSequence,
+                        max_entries: Optional[int] = None,
+                        policy: str = "reset", preset=None) -> int:
+    # Only the parent index and last symbol of every word are kept. Each
+    # word is written backwards into `out` by following the parent chain,
+    # and symbols are looked up in the alphabet only as they are written.
+    tokens = as_tokens(tokens)
+    wordbook = Wordbook(max_entries, policy, track_children=False,
+                        preset=preset, alphabet=tokens.alphabet)
+    parents = wordbook.parents
+    lengths = wordbook.lengths
+    symbols = wordbook.symbols
+    alphabet = tokens.alphabet
+    position = 0
+
+    for index, symbol_index in zip(tokens.indices, tokens.symbols):
+        if index >= len(parents):
+            raise ValueError(
+                "Corrupted encoded data: dictionary index out of range.")
+        length = lengths[index] + 1
+        end = position + length
+        if end > len(out):
+            raise ValueError("Output buffer is too small for the sequence.")
+        k = end - 1
+        out[k] = alphabet[symbol_index]
+        node = index
+        while node:
+            k -= 1
+            out[k] = alphabet[symbols[node]]
+            node = parents[node]
+        wordbook.add(index, symbol_index)
+        position = end
+
+    if metrics.enabled:
+        metrics.count("lz.symbols_decoded", position)
+        metrics.trace("lz.reconstruct", tokens=len(tokens),
+                      symbols=position)
+    return position
+
+
+def lz_reconstruct_sequence(tokens: Tokens,
+                            max_entries: Optional[int] = None,
+                            policy: str = "reset", preset=None) -> str:
+    sequence: List[str] = [""] * lz_sequence_length(
+        tokens, max_entries, policy, preset)
+    lz_reconstruct_into(tokens, sequence, max_entries, policy, preset)
+    return "".join(sequence)
+
+
+def lz_encode(sequence: str, alphabet: Optional[list] = None,
+              max_entries: Optional[int] = None,
+              policy: str = "reset", preset=None) -> bytes:
+    alphabet = resolve_alphabet(sequence, alphabet)
+    tokens = lz_thesaurus(sequence, max_entries, policy, preset, alphabet)
+    encoded = lz_pack_thesaurus(tokens, alphabet, max_entries, policy,
+                                preset)
     return encoded
 
 
-def lz_decode(encoded: str, alphabet: list) -> str:
-    dictionary = lz_unpack_thesaurus(encoded, alphabet)
-    sequence = lz_reconstruct_sequence(dictionary)
-    return sequence
-
-
-def calculate_lz_efficiency(sequence: str, alphabet: list) -> float:
-    encoded = lz_encode(sequence, alphabet)
-    coded_length = len(encoded)
-    original_length = len(sequence) * ceil(log2(len(alphabet)))
-    logging.debug(f"Coded length: {coded_length} bits")
-    logging.debug(f"Original length: {original_length} bits")
-    efficiency = coded_length / original_length
-    return efficiency
+def lz_decode(encoded: bytes, alphabet: Optional[list] = None,
+              max_entries: Optional[int] = None,
+              policy: str = "reset", preset=None):
+    tokens = lz_unpack_thesaurus(encoded, alphabet, max_entries, policy,
+                                 preset)
+    sequence = symbol_buffer(alphabet, lz_sequence_length(
+        tokens, max_entries, policy, preset))
+    lz_reconstruct_into(tokens, sequence, max_entries, policy, preset)
+    return decode_symbols(sequence, alphabet)
+
+
+def lz_decode_into(encoded: bytes, alphabet: Optional[list],
+                   out: MutableSequence,
+                   max_entries: Optional[int] = None,
+                   policy: str = "reset", preset=None) -> int:
+    """Decode straight into a caller-supplied writable buffer.
+
+    `out` receives one alphabet symbol per item (a list for text alphabets,
+    or a bytearray/memoryview with `alphabet=None`) and must have room for
+    the whole sequence. Returns the number of symbols written.
+    `max_entries`, `policy` and `preset` must match the ones used to
+    encode.
+    """
+    tokens = lz_unpack_thesaurus(encoded, alphabet, max_entries, policy,
+                                 preset)
+    return lz_reconstruct_into(tokens, out, max_entries, policy, preset)
+
+
+class LZEncoder:
+    """Incremental LZ78 encoder producing the same bytes as `lz_encode`.
+
+    `feed` parses a chunk and returns the complete bytes of the tokens it
+    finished; `flush` sends the word still being matched and closes the
+    stream. Memory is bounded by the wordbook, so pass `max_entries` to
+    compress unbounded input in constant memory. With `alphabet=None` the
+    encoder is fed bytes-like chunks instead of text.
+    """
+
+    def __init__(self, alphabet: Optional[list],
+                 max_entries: Optional[int] = None, policy: str = "reset",
+                 preset=None):
+        if alphabet is None:
+            alphabet = BYTE_ALPHABET
+        self.alphabet_map = symbol_index_map(alphabet)
+        self.a = 2 ** symbol_bits(alphabet)
+        self.wordbook = Wordbook(max_entries, policy, preset=preset,
+                                 alphabet=alphabet)
+        self.node: int = 0
+        self.writer = BitWriter()
+
+    def _emit(self, index: int, symbol_index: int):
+        a = self.a
+        bits = (a * (len(self.wordbook) - 1) + (a - 1)).bit_length()
+        self.writer.write(a * index + symbol_index, bits)
+
+    def feed(self, chunk: str) -> bytes:
+        if is_byte_data(chunk):
+            chunk = byte_view(chunk)
+        wordbook = self.wordbook
+        children = wordbook.children
+        alphabet_map = self.alphabet_map
+        node = self.node
+        for word in chunk:
+            child = children.get((node, word))
+            if child is not None:
+                node = child
+                continue
+            symbol_index = alphabet_map[word]
+            self._emit(node, symbol_index)
+            wordbook.add(node, symbol_index)
+            node = 0
+        self.node = node
+        if metrics.enabled:
+            metrics.count("lz.symbols", len(chunk))
+        return self.writer.take()
+
+    def flush(self) -> bytes:
+        node = self.node
+        if node != 0:
+            self._emit(self.wordbook.parents[node], self.wordbook.symbols[node])
+            self.node = 0
+        if metrics.enabled:
+            metrics.count("lz.bits", len(self.writer))
+        return self.writer.finish()
+
+
+class LZDecoder:
+    """Incremental counterpart of `lz_decode`.
+
+    `feed` takes the next piece of the packed bytes and returns the symbols
+    of every token it could read. The last byte seen so far is held back
+    because it may end in the stop bit; `flush` decodes it. Symbols come
+    back as `decode_symbols` gives them.
+    """
+
+    def __init__(self, alphabet: Optional[list],
+                 max_entries: Optional[int] = None, policy: str = "reset",
+                 preset=None):
+        self.byte_mode: bool = alphabet is None
+        if alphabet is None:
+            alphabet = BYTE_ALPHABET
+        self.alphabet = alphabet
+        self.a = 2 ** symbol_bits(alphabet)
+        self.wordbook = Wordbook(max_entries, policy, track_children=False,
+                                 preset=preset, alphabet=alphabet)
+        self.buffer: bytes = b""
+        self.position: int = 0
+
+    def feed(self, data: bytes):
+        self.buffer = self.buffer + bytes(data)
+        return self._decode(max(0, len(self.buffer) - 1) * 8)
+
+    def flush(self):
+        decoded = self._decode(payload_bit_length(self.buffer))
+        if self.position != payload_bit_length(self.buffer):
+            logging.warning("Reached end of stream with incomplete segment.")
+        self.buffer = b""
+        self.position = 0
+        return decoded
+
+    def _decode(self, end: int):
+        a = self.a
+        alphabet = self.alphabet
+        wordbook = self.wordbook
+        parents = wordbook.parents
+        symbols = wordbook.symbols
+        reader = BitReader(self.buffer, bit_length=end)
+        reader.position = self.position
+        pieces: List[str] = []
+        while True:
+            bits = (a * (len(wordbook) - 1) + (a - 1)).bit_length()
+            if reader.remaining < bits or reader.remaining == 0:
+                break
+            xy_mapped = reader.read(bits)
+            index = xy_mapped // a
+            symbol_index = xy_mapped % a
+            if symbol_index >= len(alphabet):
+                raise ValueError(
+                    "Corrupted encoded data: symbol index out of range.")
+            if index >= len(wordbook):
+                raise ValueError(
+                    "Corrupted encoded data: dictionary index out of range.")
+            word = [alphabet[symbol_index]]
+            node = index
+            while node:
+                word.append(alphabet[symbols[node]])
+                node = parents[node]
+            pieces.extend(reversed(word))
+            wordbook.add(index, symbol_index)
+        consumed = reader.position >> 3
+        self.buffer = self.buffer[consumed:]
+        self.position = reader.position - consumed * 8
+        if metrics.enabled:
+            metrics.count("lz.symbols_decoded", len(pieces))
+        if self.byte_mode:
+            return bytes(pieces)
+        return "".join(pieces)
+
+
+def lz_encode_result(sequence: str, alphabet: Optional[list] = None,
+                     max_entries: Optional[int] = None, policy: str = "reset",
+                     cache: Optional[ResultCache] = None) -> EncodeResult:
+    """Encode once and return the payload with its size, efficiency,
+    entropy and timing.
+    """
+    alphabet = resolve_alphabet(sequence, alphabet)
+    return encode_with_stats(
+        lambda: lz_encode(sequence, alphabet, max_entries, policy), sequence,
+        alphabet, cache, ("lz", list(alphabet), max_entries, policy))
+
+
+def calculate_lz_efficiency(sequence: str, alphabet: Optional[list] = None,
+                            max_entries: Optional[int] = None,
+                            policy: str = "reset") -> float:
+    result = lz_encode_result(sequence, alphabet, max_entries, policy)
+    logging.debug("Coded length: %d bits", result.bits)
+    logging.debug("Original length: %d bits", result.original_bits)
+    return result.efficiency
+
+
+# LZW: the dictionary starts out holding every single symbol of the
+# alphabet, so tokens are bare dictionary codes with no explicit symbol.
+# Code k (counting from 0) is written with just enough bits for the
+# len(alphabet) + k entries the dictionary holds at that point.
+
+
+def _lzw_code_bits(alphabet_size: int, count: int) -> int:
+    return max(1, (alphabet_size + count - 1).bit_length())
+
+
+@metrics.timed("lzw.parse")
+def lzw_codes(sequence: str, alphabet: Optional[list] = None) -> array:
+    """Parse `sequence` into LZW codes.
+
+    The dictionary is a trie keyed by (code, symbol); the codes below
+    len(alphabet) are the single symbols.
+    """
+    if alphabet is None:
+        alphabet = BYTE_ALPHABET
+    if is_byte_data(sequence):
+        sequence = byte_view(sequence)
+    alphabet_map = symbol_index_map(alphabet)
+    children: Dict[Tuple[int, Any], int] = {}
+    next_code = len(alphabet)
+    codes = array("L")
+    iterator = iter(sequence)
+    for first in iterator:
+        node = alphabet_map[first]
+        break
+    else:
+        return codes
+    for symbol in iterator:
+        child = children.get((node, symbol))
+        if child is not None:
+            node = child
+            continue
+        codes.append(node)
+        children[(node, symbol)] = next_code
+        next_code += 1
+        node = alphabet_map[symbol]
+    codes.append(node)
+    if metrics.enabled:
+        metrics.count("lzw.symbols", len(sequence))
+        metrics.count("lzw.codes", len(codes))
+        metrics.gauge("lzw.dictionary_size", next_code)
+        metrics.trace("lzw.parse", symbols=len(sequence), codes=len(codes),
+                      dictionary_size=next_code)
+    return codes
+
+
+@metrics.timed("lzw.pack")
+def lzw_pack(codes: array, alphabet: Optional[list] = None) -> bytes:
+    alphabet_size = len(BYTE_ALPHABET if alphabet is None else alphabet)
+    writer = BitWriter()
+    for count, code in enumerate(codes):
+        writer.write(code, _lzw_code_bits(alphabet_size, count))
+    if metrics.enabled:
+        metrics.count("lzw.bits", len(writer))
+    return writer.finish()
+
+
+@metrics.timed("lzw.unpack")
+def lzw_unpack(encoded: bytes, alphabet: Optional[list] = None) -> array:
+    alphabet_size = len(BYTE_ALPHABET if alphabet is None else alphabet)
+    reader = BitReader(encoded, terminated=True)
+    codes = array("L")
+    while reader.remaining:
+        bits = _lzw_code_bits(alphabet_size, len(codes))
+        if reader.remaining < bits:
+            raise ValueError("Corrupted encoded data: truncated code.")
+        codes.append(reader.read(bits))
+    return codes
+
+
+@metrics.timed("lzw.reconstruct")
+def lzw_reconstruct_into(codes: array, alphabet: Optional[list],
+                         out: MutableSequence) -> MutableSequence:
+    """Append the symbols of `codes` to `out` (a list or a bytearray).
+
+    Every dictionary word beyond the single symbols is a piece of the output
+    already written, so the dictionary is just the start and length of that
+    piece: no strings are built and every word is a slice copy.
+    """
+    if alphabet is None:
+        alphabet = BYTE_ALPHABET
+    alphabet_size = len(alphabet)
+    starts = array("L")
+    lengths = array("L")
+    previous_start = previous_length = 0
+    for count, code in enumerate(codes):
+        start = len(out)
+        if count:
+            # Every code after the first adds the previous word plus the
+            # first symbol of this one, which is where it sits in `out`
+            starts.append(previous_start)
+            lengths.append(previous_length + 1)
+        entry = code - alphabet_size
+        if entry < 0:
+            out.append(alphabet[code])
+            length = 1
+        elif entry < len(starts) - 1:
+            length = lengths[entry]
+            out += out[starts[entry]:starts[entry] + length]
+        elif entry == len(starts) - 1:
+            # The entry just added: its last symbol is its own first one
+            length = previous_length + 1
+            out += out[previous_start:previous_start + previous_length]
+            out.append(out[previous_start])
+        else:
+            raise ValueError(
+                "Corrupted encoded data: dictionary code out of range.")
+        previous_start, previous_length = start, length
+    return out
+
+
+def lzw_encode(sequence: str, alphabet: Optional[list] = None) -> bytes:
+    alphabet = resolve_alphabet(sequence, alphabet)
+    return lzw_pack(lzw_codes(sequence, alphabet), alphabet)
+
+
+def lzw_decode(encoded: bytes, alphabet: Optional[list] = None):
+    codes = lzw_unpack(encoded, alphabet)
+    return decode_symbols(
+        lzw_reconstruct_into(codes, alphabet, symbol_buffer(alphabet)),
+        alphabet)
+
+
+def lzw_encode_result(sequence: str, alphabet: Optional[list] = None,
+                      cache: Optional[ResultCache] = None) -> EncodeResult:
+    alphabet = resolve_alphabet(sequence, alphabet)
+    return encode_with_stats(lambda: lzw_encode(sequence, alphabet),
+                             sequence, alphabet, cache,
+                             ("lzw", list(alphabet)))
+
+
+def calculate_lzw_efficiency(sequence: str,
+                             alphabet: Optional[list] = None) -> float:
+    return lzw_encode_result(sequence, alphabet).efficiency
+
+
+# LZ77/LZSS: repeats are coded as (distance, length) back-references into a
+# sliding window over the last `window_size` symbols, and everything else as
+# a literal. Each token starts with a flag bit, 0 for a literal followed by
+# its symbol index, 1 for a match followed by distance - 1 and
+# length - LZSS_MIN_MATCH.
+LZSS_MIN_MATCH = 3
+DEFAULT_WINDOW_SIZE = 4096
+DEFAULT_MAX_MATCH = 258
+DEFAULT_LEVEL = 6
+
+# level: (max_chain, lazy, nice_length). Higher levels follow longer hash
+# chains and look one symbol ahead before taking a match; the search stops
+# early once a match reaches nice_length.
+LZSS_LEVELS: Dict[int, Tuple[int, bool, int]] = {
+    1: (4, False, 16),
+    2: (8, False, 32),
+    3: (16, False, 64),
+    4: (16, True, 32),
+    5: (32, True, 64),
+    6: (128, True, 128),
+    7: (256, True, 258),
+    8: (1024, True, 258),
+    9: (4096, True, 258),
+}
+
+
+def _check_lzss_params(window_size: int, max_match: int):
+    if window_size < 1:
+        raise ValueError("Window size must be a positive integer.")
+    if max_match < LZSS_MIN_MATCH:
+        raise ValueError(
+            f"Maximum match length must be at least {LZSS_MIN_MATCH}.")
+
+
+@metrics.timed("lzss.parse")
+def lzss_tokens(sequence: str, window_size: int = DEFAULT_WINDOW_SIZE,
+                max_match: int = DEFAULT_MAX_MATCH,
+                level: int = DEFAULT_LEVEL) -> List[Tuple[int, Any]]:
+    """Parse `sequence` into LZSS tokens.
+
+    Literals are `(0, symbol)` and matches `(distance, length)`. Matches are
+    found with hash chains: `head` maps every LZSS_MIN_MATCH-symbol string
+    to its latest position and `prev` links each position in the window to
+    the previous one with the same string.
+    """
+    _check_lzss_params(window_size, max_match)
+    if level not in LZSS_LEVELS:
+        raise ValueError(f"Unknown LZSS level: {level!r}")
+    max_chain, lazy, nice_length = LZSS_LEVELS[level]
+    if is_byte_data(sequence):
+        # Slices of bytes are hashable, slices of a memoryview are not
+        sequence = bytes(sequence)
+    n = len(sequence)
+    last_key = n - LZSS_MIN_MATCH
+    head: Dict[Any, int] = {}
+    prev = array("l", [-1]) * window_size
+    inserted = 0
+
+    def insert_until(end: int):
+        # Positions go into the chains in order, each exactly once
+        nonlocal inserted
+        for pos in range(inserted, min(end, last_key + 1)):
+            key = sequence[pos:pos + LZSS_MIN_MATCH]
+            prev[pos % window_size] = head.get(key, -1)
+            head[key] = pos
+        inserted = max(inserted, end)
+
+    def longest_match(pos: int) -> Tuple[int, int]:
+        limit = min(max_match, n - pos)
+        if limit < LZSS_MIN_MATCH:
+            return 0, 0
+        nice = min(nice_length, limit)
+        best_distance, best_length = 0, LZSS_MIN_MATCH - 1
+        candidate = head.get(sequence[pos:pos + LZSS_MIN_MATCH], -1)
+        lowest = pos - window_size
+        chain = max_chain
+        while candidate >= lowest and candidate >= 0 and chain:
+            # Only a candidate that also matches at best_length can beat it
+            if sequence[candidate + best_length] == \
+                    sequence[pos + best_length]:
+                length = 0
+                while length < limit and \
+                        sequence[candidate + length] == sequence[pos + length]:
+                    length += 1
+                if length > best_length:
+                    best_distance, best_length = pos - candidate, length
+                    if length >= nice:
+                        break
+            candidate = prev[candidate % window_size]
+            chain -= 1
+        if not best_distance:
+            return 0, 0
+        return best_distance, best_length
+
+    tokens: List[Tuple[int, Any]] = []
+    pos = 0
+    lookahead: Optional[Tuple[int, int]] = None
+    while pos < n:
+        insert_until(pos)
+        distance, length = lookahead or longest_match(pos)
+        lookahead = None
+        if length and lazy and length < nice_length and pos + 1 < n:
+            # Lazy matching: a longer match one symbol later is worth a
+            # literal now
+            insert_until(pos + 1)
+            lookahead = longest_match(pos + 1)
+            if lookahead[1] > length:
+                tokens.append((0, sequence[pos]))
+                pos += 1
+                continue
+            lookahead = None
+        if length:
+            tokens.append((distance, length))
+            insert_until(pos + length)
+            pos += length
+        else:
+            tokens.append((0, sequence[pos]))
+            pos += 1
+
+    if metrics.enabled:
+        matches = sum(1 for distance, _ in tokens if distance)
+        metrics.count("lzss.symbols", n)
+        metrics.count("lzss.matches", matches)
+        metrics.count("lzss.literals", len(tokens) - matches)
+        metrics.trace("lzss.parse", symbols=n, matches=matches,
+                      literals=len(tokens) - matches)
+    return tokens
+
+
+@metrics.timed("lzss.pack")
+def lzss_pack(tokens: List[Tuple[int, Any]], alphabet: Optional[list] = None,
+              window_size: int = DEFAULT_WINDOW_SIZE,
+              max_match: int = DEFAULT_MAX_MATCH) -> bytes:
+    _check_lzss_params(window_size, max_match)
+    if alphabet is None:
+        alphabet = BYTE_ALPHABET
+    alphabet_map = symbol_index_map(alphabet)
+    index_bits = symbol_bits(alphabet)
+    distance_bits = (window_size - 1).bit_length()
+    length_bits = (max_match - LZSS_MIN_MATCH).bit_length()
+    writer = BitWriter()
+    for distance, value in tokens:
+        if distance:
+            writer.write(1, 1)
+            writer.write(distance - 1, distance_bits)
+            writer.write(value - LZSS_MIN_MATCH, length_bits)
+        else:
+            writer.write(0, 1)
+            writer.write(alphabet_map[value], index_bits)
+    if metrics.enabled:
+        metrics.count("lzss.bits", len(writer))
+    return writer.finish()
+
+
+@metrics.timed("lzss.unpack")
+def lzss_unpack(encoded: bytes, alphabet: Optional[list] = None,
+                window_size: int = DEFAULT_WINDOW_SIZE,
+                max_match: int = DEFAULT_MAX_MATCH) -> List[Tuple[int, Any]]:
+    _check_lzss_params(window_size, max_match)
+    if alphabet is None:
+        alphabet = BYTE_ALPHABET
+    index_bits = symbol_bits(alphabet)
+    distance_bits = (window_size - 1).bit_length()
+    length_bits = (max_match - LZSS_MIN_MATCH).bit_length()
+    reader = BitReader(encoded, terminated=True)
+    tokens: List[Tuple[int, Any]] = []
+    try:
+        while reader.remaining:
+            if reader.read(1):
+                distance = reader.read(distance_bits) + 1
+                length = reader.read(length_bits) + LZSS_MIN_MATCH
+                if length > max_match:
+                    raise ValueError(
+                        "Corrupted encoded data: match length out of range.")
+                tokens.append((distance, length))
+            else:
+                symbol_index = reader.read(index_bits)
+                if symbol_index >= len(alphabet):
+                    raise ValueError(
+                        "Corrupted encoded data: symbol index out of range.")
+                tokens.append((0, alphabet[symbol_index]))
+    except EOFError:
+        raise ValueError("Corrupted encoded data: truncated token.") from None
+    return tokens
+
+
+@metrics.timed("lzss.reconstruct")
+def lzss_reconstruct(tokens: List[Tuple[int, Any]], out: MutableSequence):
+    """Append the symbols of `tokens` to `out` (a list or a bytearray)."""
+    for distance, value in tokens:
+        if not distance:
+            out.append(value)
+            continue
+        start = len(out) - distance
+        if start < 0:
+            raise ValueError(
+                "Corrupted encoded data: match reaches before the start.")
+        if distance >= value:
+            out += out[start:start + value]
+        else:
+            # The match overlaps the symbols it produces
+            for k in range(start, start + value):
+                out.append(out[k])
+    return out
+
+
+def lzss_encode(sequence: str, alphabet: Optional[list] = None,
+                window_size: int = DEFAULT_WINDOW_SIZE,
+                max_match: int = DEFAULT_MAX_MATCH,
+                level: int = DEFAULT_LEVEL) -> bytes:
+    alphabet = resolve_alphabet(sequence, alphabet)
+    tokens = lzss_tokens(sequence, window_size, max_match, level)
+    return lzss_pack(tokens, alphabet, window_size, max_match)
+
+
+def lzss_decode(encoded: bytes, alphabet: Optional[list] = None,
+                window_size: int = DEFAULT_WINDOW_SIZE,
+                max_match: int = DEFAULT_MAX_MATCH):
+    tokens = lzss_unpack(encoded, alphabet, window_size, max_match)
+    return decode_symbols(lzss_reconstruct(tokens, symbol_buffer(alphabet)),
+                          alphabet)
+
+
+def lzss_encode_result(sequence: str, alphabet: Optional[list] = None,
+                       window_size: int = DEFAULT_WINDOW_SIZE,
+                       max_match: int = DEFAULT_MAX_MATCH,
+                       level: int = DEFAULT_LEVEL,
+                       cache: Optional[ResultCache] = None) -> EncodeResult:
+    alphabet = resolve_alphabet(sequence, alphabet)
+    return encode_with_stats(
+        lambda: lzss_encode(sequence, alphabet, window_size, max_match,
+                            level),
+        sequence, alphabet, cache,
+        ("lzss", list(alphabet), window_size, max_match, level))
+
+
+def calculate_lzss_efficiency(sequence: str, alphabet: Optional[list] = None,
+                              window_size: int = DEFAULT_WINDOW_SIZE,
+                              max_match: int = DEFAULT_MAX_MATCH,
+                              level: int = DEFAULT_LEVEL) -> float:
+    return lzss_encode_result(sequence, alphabet, window_size, max_match,
+                              level).efficiency
 
 
 if __name__ == "__main__":
@@ -181,7 +1007,7 @@ if __name__ == "__main__":
         alphabet = sorted(list(set(seq)))
         # print(f"Processing {name} with alphabet: {alphabet}")
         encoded = lz_encode(seq, alphabet)
-        print(f"Lempel-Ziv Encoded {name}: {encoded}")
+        print(f"Lempel-Ziv Encoded {name}: {to_bit_string(encoded)}")
         # decoded = lz_decode(encoded, alphabet)
         # print(f"Decoded {name}: {decoded}")
         # assert decoded == seq, "Decoded sequence does not match original!"
@@ -1,22 +1,42 @@
 import sys
-from typing import List
+from typing import List, Optional
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QLabel, QLineEdit, QTextEdit,
     QPushButton, QRadioButton, QButtonGroup, QVBoxLayout, QHBoxLayout,
-    QGroupBox, QMessageBox, QFormLayout, QGridLayout
+    QGroupBox, QMessageBox, QFormLayout, QGridLayout, QProgressBar,
+    QFileDialog
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThreadPool
 
-from arithmetic import (
-    adaptive_arithmetic_encode,
-    adaptive_arithmetic_decode,
-    calculate_adaptive_efficiency
-)
-from lempel_ziv import (
-    lz_encode,
-    lz_decode,
-    calculate_lz_efficiency
-)
+from bitstream import from_bit_string, payload_bit_length, to_bit_string
+from arithmetic import ArithmeticDecoder, ArithmeticEncoder
+from lempel_ziv import LZDecoder, LZEncoder
+from results import ResultCache, encode_with_stats
+from streams import code_chunks
+from workers import CodecWorker
+
+# Text boxes only get this many characters; anything longer is cut short
+# and can be written out in full with the Save buttons.
+DISPLAY_LIMIT = 100_000
+# Symbols (or encoded bytes) coded between progress updates
+CHUNK_SIZE = 16 * 1024
+
+
+def preview(text: str, limit: int = DISPLAY_LIMIT) -> str:
+    if len(text) <= limit:
+        return text
+    return (text[:limit] + f"\n... {len(text) - limit:,} more characters "
+            f"not shown, use Save to keep all of it.")
+
+
+def bit_preview(payload: bytes, limit: int = DISPLAY_LIMIT) -> str:
+    # Only the bits that are shown get turned into text
+    bits = payload_bit_length(payload)
+    if bits <= limit:
+        return to_bit_string(payload)
+    shown = "".join(format(byte, "08b") for byte in payload[:limit // 8])
+    return (shown + f"\n... {bits - len(shown):,} more bits not shown, "
+            f"use Save to keep all of them.")
 
 
 class CoderGUI(QMainWindow):
@@ -27,6 +47,15 @@ class CoderGUI(QMainWindow):
 
         self.last_sequence: str = ""
         self.last_alphabet: List[str] = []
+        self.last_payload: bytes = b""
+        self.last_decoded: str = ""
+        # Payload read with Open..., decoded when the binary field is empty
+        self.loaded_code: bytes = b""
+        self.pool = QThreadPool.globalInstance()
+        self.worker: Optional[CodecWorker] = None
+        self.job_description: str = ""
+        # Encoding the same input again is answered from here
+        self.results = ResultCache()
 
         central = QWidget()
         self.setCentralWidget(central)
@@ -69,6 +98,9 @@ class CoderGUI(QMainWindow):
         self.encoded_output = QTextEdit()
         self.encoded_output.setReadOnly(True)
         enc_layout.addWidget(self.encoded_output, 4, 1)
+        self.save_encoded_btn = QPushButton("Save...")
+        self.save_encoded_btn.clicked.connect(self.save_encoded)
+        enc_layout.addWidget(self.save_encoded_btn, 4, 2)
 
         enc_layout.addWidget(QLabel("Efficiency"), 5, 0)
         self.eff_label = QLabel("-")
@@ -85,6 +117,9 @@ class CoderGUI(QMainWindow):
         self.binary_input.setPlaceholderText(
             "Paste binary string produced by encoder")
         dec_layout.addWidget(self.binary_input, 0, 1)
+        self.open_btn = QPushButton("Open...")
+        self.open_btn.clicked.connect(self.open_encoded)
+        dec_layout.addWidget(self.open_btn, 0, 2)
 
         dec_layout.addWidget(
             QLabel("Alphabet (optional, comma-separated)"), 1, 0)
@@ -107,6 +142,9 @@ class CoderGUI(QMainWindow):
         self.decoded_output = QTextEdit()
         self.decoded_output.setReadOnly(True)
         dec_layout.addWidget(self.decoded_output, 4, 1)
+        self.save_decoded_btn = QPushButton("Save...")
+        self.save_decoded_btn.clicked.connect(self.save_decoded)
+        dec_layout.addWidget(self.save_decoded_btn, 4, 2)
 
         layout.addWidget(dec_group)
 
@@ -125,6 +163,13 @@ class CoderGUI(QMainWindow):
         self.clear_btn.clicked.connect(self.clear_all)
         foot_layout.addWidget(self.clear_btn)
         foot_layout.addStretch()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        foot_layout.addWidget(self.progress_bar)
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_job)
+        foot_layout.addWidget(self.cancel_btn)
         layout.addWidget(footer)
 
         self.log("Ready. Choose algorithm, enter sequence, and press Encode.")
@@ -140,8 +185,86 @@ class CoderGUI(QMainWindow):
         self.decoded_output.clear()
         self.alphabet_input.clear()
         self.length_input.clear()
+        self.last_payload = b""
+        self.last_decoded = ""
+        self.loaded_code = b""
         self.log("Cleared all fields.")
 
+    def start_job(self, job, on_finished, description: str):
+        """Run `job` on the thread pool; the window stays usable meanwhile."""
+        self.worker = CodecWorker(job)
+        self.worker.signals.progress.connect(self.show_progress)
+        self.worker.signals.finished.connect(on_finished)
+        self.worker.signals.failed.connect(self.job_failed)
+        self.worker.signals.cancelled.connect(self.job_cancelled)
+        self.job_description = description
+        self.set_busy(True)
+        self.pool.start(self.worker)
+
+    def set_busy(self, busy: bool):
+        self.encode_btn.setEnabled(not busy)
+        self.decode_btn.setEnabled(not busy)
+        self.clear_btn.setEnabled(not busy)
+        self.cancel_btn.setEnabled(busy)
+        self.progress_bar.setValue(0)
+
+    def job_done(self):
+        self.worker = None
+        self.set_busy(False)
+        self.progress_bar.setValue(100)
+
+    def show_progress(self, done: int, total: int):
+        self.progress_bar.setValue(done * 100 // total if total else 100)
+
+    def cancel_job(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.log(f"Cancelling {self.job_description}...")
+
+    def job_cancelled(self):
+        self.job_done()
+        self.progress_bar.setValue(0)
+        self.log(f"{self.job_description.capitalize()} cancelled.")
+
+    def job_failed(self, message: str):
+        self.job_done()
+        self.log(f"Error during {self.job_description}: {message}")
+        QMessageBox.critical(self, f"{self.job_description.capitalize()} "
+                                   f"error", f"An error occurred: {message}")
+
+    def save_encoded(self):
+        if not self.last_payload:
+            QMessageBox.warning(self, "Nothing to save",
+                                "Encode a sequence first.")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Save encoded output")
+        if path:
+            with open(path, "wb") as f:
+                f.write(self.last_payload)
+            self.log(f"Saved {len(self.last_payload)} encoded bytes to "
+                     f"{path}.")
+
+    def save_decoded(self):
+        if not self.last_decoded:
+            QMessageBox.warning(self, "Nothing to save",
+                                "Decode a sequence first.")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Save decoded output")
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.last_decoded)
+            self.log(f"Saved {len(self.last_decoded)} decoded symbols to "
+                     f"{path}.")
+
+    def open_encoded(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Open encoded output")
+        if path:
+            with open(path, "rb") as f:
+                self.loaded_code = f.read()
+            self.binary_input.clear()
+            self.log(f"Loaded {len(self.loaded_code)} encoded bytes from "
+                     f"{path}. Leave the binary field empty to decode them.")
+
     def do_encode(self):
         seq = self.seq_input.text().lower()
         if not seq:
@@ -149,37 +272,38 @@ class CoderGUI(QMainWindow):
                                 "Please enter a sequence to encode.")
             return
 
-        try:
-            if self.radio_arith.isChecked():
-                self.log(
-                    f"Encoding using Adaptive Arithmetic: sequence length {len(seq)}")
-                encoded = adaptive_arithmetic_encode(seq)
-                eff = calculate_adaptive_efficiency(
-                    seq, sorted(list(set(seq))))
-            else:
-                self.log(
-                    f"Encoding using Lempel-Ziv: sequence length {len(seq)}")
-                encoded = lz_encode(seq, sorted(list(set(seq))))
-                eff = calculate_lz_efficiency(seq, sorted(list(set(seq))))
-
-            self.encoded_output.setPlainText(encoded)
-            if eff is None:
-                self.eff_label.setText("-")
-            else:
-                try:
-                    eff_f = float(eff)
-                    self.eff_label.setText(f"{eff_f:.4f}")
-                except Exception:
-                    self.eff_label.setText(str(eff))
-
+        alphabet = sorted(list(set(seq)))
+        # Both codecs run through their streaming encoders so progress can
+        # be reported and the job stopped between chunks
+        if self.radio_arith.isChecked():
+            name = "Adaptive Arithmetic"
+            encoder = ArithmeticEncoder(alphabet)
+            settings = ("arithmetic", "integer", list(alphabet))
+        else:
+            name = "Lempel-Ziv"
+            encoder = LZEncoder(alphabet)
+            settings = ("lz", list(alphabet), None, "reset")
+        self.log(f"Encoding using {name}: sequence length {len(seq)}")
+
+        def job(progress, cancelled):
+            return encode_with_stats(
+                lambda: code_chunks(encoder, seq, CHUNK_SIZE, progress,
+                                    cancelled),
+                seq, alphabet, self.results, settings)
+
+        def finished(result):
+            self.job_done()
+            self.last_payload = result.payload
+            self.encoded_output.setPlainText(bit_preview(result.payload))
+            self.eff_label.setText(f"{result.efficiency:.4f}")
             self.last_sequence = seq
-            self.last_alphabet = sorted(list(set(seq)))
-            self.log(f"Encoding complete. Output bits: {
-                     len(encoded)}. Alphabet: {self.last_alphabet}")
-        except Exception as e:
-            self.log(f"Error during encoding: {e}")
-            QMessageBox.critical(self, "Encoding error",
-                                 f"An error occurred: {e}")
+            self.last_alphabet = alphabet
+            self.log(f"Encoding complete. Output bits: {result.bits}. "
+                     f"Entropy: {result.entropy:.4f} bits/symbol. "
+                     f"Time: {result.seconds * 1000:.1f} ms. "
+                     f"Alphabet: {self.last_alphabet}")
+
+        self.start_job(job, finished, "encoding")
 
     def parse_alphabet_field(self) -> List[str]:
         txt = self.alphabet_input.text().strip()
@@ -194,56 +318,72 @@ class CoderGUI(QMainWindow):
         return []
 
     def do_decode(self):
-        code = self.binary_input.text().strip()
-        if not code:
+        bits = self.binary_input.text().strip()
+        if not bits and not self.loaded_code:
             QMessageBox.warning(self, "Input required",
                                 "Please paste the binary string to decode.")
             return
 
         try:
-            alphabet = self.parse_alphabet_field()
-            if not alphabet:
-                QMessageBox.warning(
-                    self, "Alphabet required", "Please provide an alphabet (comma-separated) or encode a sequence first so the alphabet can be inferred.")
-                return
-
-            if self.radio_arith.isChecked():
-                length_text = self.length_input.text().strip()
-                if length_text:
-                    try:
-                        expected_len = int(length_text)
-                        if expected_len <= 0:
-                            raise ValueError()
-                    except ValueError:
-                        QMessageBox.warning(
-                            self, "Bad length", "Decoded length must be a positive integer.")
-                        return
-                else:
-                    if self.last_sequence:
-                        expected_len = len(self.last_sequence)
-                        self.log(f"No length provided. Using last encoded sequence length {
-                                 expected_len}.")
-                    else:
-                        QMessageBox.warning(
-                            self, "Length required", "Adaptive arithmetic decoding requires the number of symbols to decode. Provide it in 'Decoded length' or encode a sequence first.")
-                        return
-
-                self.log(f"Decoding (Arithmetic) with alphabet {
-                         alphabet} and expected length {expected_len}")
-                decoded = adaptive_arithmetic_decode(
-                    code, alphabet, expected_len)
-                self.decoded_output.setPlainText(decoded)
-                self.log("Adaptive arithmetic decoding complete.")
-            else:
-                self.log(f"Decoding (LZ) with alphabet {alphabet}")
-                decoded = lz_decode(code, alphabet)
-                self.decoded_output.setPlainText(decoded)
-                self.log("Lempel-Ziv decoding complete.")
-
-        except Exception as e:
-            self.log(f"Error during decoding: {e}")
+            code = from_bit_string(bits) if bits else self.loaded_code
+        except ValueError as e:
             QMessageBox.critical(self, "Decoding error",
                                  f"An error occurred: {e}")
+            return
+        alphabet = self.parse_alphabet_field()
+        if not alphabet:
+            QMessageBox.warning(
+                self, "Alphabet required",
+                "Please provide an alphabet (comma-separated) or encode a "
+                "sequence first so the alphabet can be inferred.")
+            return
+
+        if self.radio_arith.isChecked():
+            length_text = self.length_input.text().strip()
+            if length_text:
+                try:
+                    expected_len = int(length_text)
+                    if expected_len <= 0:
+                        raise ValueError()
+                except ValueError:
+                    QMessageBox.warning(
+                        self, "Bad length",
+                        "Decoded length must be a positive integer.")
+                    return
+            else:
+                if self.last_sequence:
+                    expected_len = len(self.last_sequence)
+                    self.log(f"No length provided. Using last encoded "
+                             f"sequence length {expected_len}.")
+                else:
+                    QMessageBox.warning(
+                        self, "Length required",
+                        "Adaptive arithmetic decoding requires the number of "
+                        "symbols to decode. Provide it in 'Decoded length' "
+                        "or encode a sequence first.")
+                    return
+
+            self.log(f"Decoding (Arithmetic) with alphabet {alphabet} and "
+                     f"expected length {expected_len}")
+            name = "Adaptive arithmetic"
+            decoder = ArithmeticDecoder(alphabet, expected_len)
+        else:
+            self.log(f"Decoding (LZ) with alphabet {alphabet}")
+            name = "Lempel-Ziv"
+            decoder = LZDecoder(alphabet)
+
+        def job(progress, cancelled):
+            # Progress here counts encoded bytes consumed
+            return code_chunks(decoder, code, CHUNK_SIZE, progress,
+                               cancelled)
+
+        def finished(decoded):
+            self.job_done()
+            self.last_decoded = decoded
+            self.decoded_output.setPlainText(preview(decoded))
+            self.log(f"{name} decoding complete.")
+
+        self.start_job(job, finished, "decoding")
 
 
 def main():
@@ -0,0 +1,334 @@
+from array import array
+from typing import List, Optional, Tuple
+
+# Totals are kept well below the integer engine's quarter range so every
+# symbol keeps a non-empty interval after scaling
+MAX_TOTAL = 1 << 16
+
+
+class AdaptiveModel:
+    """Adaptive frequency model over symbols ``0 .. size - 1``.
+
+    Counts live in a binary indexed (Fenwick) tree, so both updating a
+    symbol and looking up its cumulative frequency are O(log size). Every
+    symbol starts with a count of 1, or with its prior from ``counts``, and
+    all counts are halved whenever the total reaches ``max_total``.
+    """
+
+    def __init__(self, size: int, max_total: int = MAX_TOTAL,
+                 increment: int = 1, counts: Optional[List[int]] = None):
+        if size > max_total:
+            raise ValueError("Alphabet is larger than the maximum total.")
+        if counts is not None and (len(counts) != size or min(counts) < 1
+                                   or sum(counts) >= max_total):
+            raise ValueError("Prior counts must be positive, one per symbol "
+                             "and sum below the maximum total.")
+        self.size: int = size
+        self.max_total: int = max_total
+        self.increment: int = increment
+        self.counts: List[int] = [1] * size if counts is None \
+            else list(counts)
+        self.tree: List[int] = [0] * (size + 1)
+        self.total: int = 0
+        # Largest power of two not above size, where tree descent starts
+        self.top: int = 1 << (size.bit_length() - 1) if size else 0
+        self._rebuild()
+
+    def _rebuild(self):
+        tree = [0] + self.counts
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                tree[parent] += tree[i]
+        self.tree = tree
+        self.total = sum(self.counts)
+
+    def cumulative(self, symbol: int) -> int:
+        """Total count of the symbols strictly before ``symbol``."""
+        tree = self.tree
+        result = 0
+        while symbol > 0:
+            result += tree[symbol]
+            symbol &= symbol - 1
+        return result
+
+    def frequency(self, symbol: int) -> int:
+        return self.counts[symbol]
+
+    def interval(self, symbol: int) -> Tuple[int, int]:
+        low = self.cumulative(symbol)
+        return low, low + self.counts[symbol]
+
+    def find(self, target: int) -> int:
+        """Symbol whose cumulative interval contains ``target``.
+
+        Descends the Fenwick tree instead of scanning the alphabet, so the
+        lookup is O(log size). ``target`` must be below ``total``.
+        """
+        tree = self.tree
+        size = self.size
+        position = 0
+        step = self.top
+        while step:
+            candidate = position + step
+            if candidate <= size and tree[candidate] <= target:
+                target -= tree[candidate]
+                position = candidate
+            step >>= 1
+        return position
+
+    def update(self, symbol: int):
+        increment = self.increment
+        self.counts[symbol] += increment
+        self.total += increment
+        tree = self.tree
+        size = self.size
+        i = symbol + 1
+        while i <= size:
+            tree[i] += increment
+            i += i & -i
+        if self.total >= self.max_total:
+            self.rescale()
+
+    def rescale(self):
+        # Halve every count but never let a symbol drop to zero
+        self.counts = [(count + 1) // 2 for count in self.counts]
+        self._rebuild()
+
+    # Coding through a SymbolEncoder/SymbolDecoder (see arithmetic.py), so
+    # this model and ContextModel can be used interchangeably
+
+    def encode(self, coder, symbol: int):
+        coder.encode(self, symbol)
+
+    def decode(self, coder) -> int:
+        return coder.decode(self)
+
+
+DEFAULT_ORDER = 2
+DEFAULT_TABLE_SIZE = 1 << 16
+DEFAULT_SLOT_CAPACITY = 64
+MIN_TABLE_SIZE = 64
+HASH_MULTIPLIER = 0x100000001B3
+HASH_MASK = (1 << 64) - 1
+
+
+def context_table_size(length: int,
+                       table_size: int = DEFAULT_TABLE_SIZE) -> int:
+    """Slots per order for coding `length` symbols, at most `table_size`.
+
+    An input never has more contexts of one order than symbols, so the
+    table only grows to the power of two covering `length`; short inputs
+    then do not pay for the full table, which is allocated up front.
+    """
+    fitted = max(MIN_TABLE_SIZE, 1 << (length - 1).bit_length())
+    return min(table_size, fitted)
+
+
+class ContextModel:
+    """PPM-style model over symbols ``0 .. size - 1``.
+
+    A symbol is predicted from the ``order`` symbols before it. If it has
+    not been seen after that context, an escape is coded and the context
+    one symbol shorter is tried, down to order 0; symbols that were already
+    ruled out at a higher order are left out (exclusion). A symbol never
+    seen at all is finally coded uniformly over the rest of the alphabet.
+    Escapes are counted PPMC-style, one per distinct symbol in a context.
+
+    Contexts of each order above 0 are hashed into ``table_size`` slots.
+    A slot holds up to ``slot_capacity`` symbols seen after its context and
+    their counts; once it is full, a new symbol replaces the least counted
+    one. A different context hashing to the same slot takes it over. All
+    slots of an order share flat arrays allocated up front, so memory is
+    ``order * table_size * (16 + slot_capacity * 3)`` bytes whatever the
+    input: 16 bytes of tag, fill and total per slot, then one byte per
+    symbol (four above 256 symbols) and two per count for every cell.
+    """
+
+    def __init__(self, size: int, order: int = DEFAULT_ORDER,
+                 table_size: int = DEFAULT_TABLE_SIZE,
+                 max_total: int = MAX_TOTAL,
+                 slot_capacity: int = DEFAULT_SLOT_CAPACITY):
+        if size > max_total:
+            raise ValueError("Alphabet is larger than the maximum total.")
+        if order < 0:
+            raise ValueError("Context order cannot be negative.")
+        if table_size < 1:
+            raise ValueError("Table size must be a positive integer.")
+        if slot_capacity < 1:
+            raise ValueError("Slot capacity must be a positive integer.")
+        self.size: int = size
+        self.order: int = order
+        self.table_size: int = table_size
+        self.max_total: int = max_total
+        # No slot can see more distinct symbols than the alphabet has
+        self.capacity: int = min(slot_capacity, size)
+        # Counts and their total stay below max_total, see _update
+        count_code = 'H' if max_total <= 1 << 16 else 'I'
+        cells = table_size * self.capacity
+        # One table per order 1..order: the full hash of the context in
+        # each slot, how many symbols the slot holds and their total count,
+        # and the symbols and counts of slot i at
+        # [i * capacity, i * capacity + fill)
+        self.tags: List[array] = [
+            array('Q', [0]) * table_size for _ in range(order)]
+        self.fills: List[array] = [
+            array('I', [0]) * table_size for _ in range(order)]
+        self.totals: List[array] = [
+            array('I', [0]) * table_size for _ in range(order)]
+        self.symbols: list = [
+            self._symbol_cells(cells) for _ in range(order)]
+        self.counts: List[array] = [
+            array(count_code, [0]) * cells for _ in range(order)]
+        # Order 0 is a single context, so it simply grows to the alphabet
+        self.order0_symbols = self._symbol_cells(0)
+        self.order0_counts = array(count_code)
+        self.order0_total = array('I', [0])
+        self.history: List[int] = []
+
+    def _symbol_cells(self, cells: int):
+        # Symbols are looked up on every update, and bytearray.index is a
+        # plain memory scan where array.index compares boxed ints
+        if self.size <= 256:
+            return bytearray(cells)
+        return array('I', [0]) * cells
+
+    def _contexts(self) -> list:
+        """(table, slot, hash, entry) for every order, highest first.
+
+        `entry` is (symbols, counts, start, end), the context's cells, or
+        None when the context has not been seen (or lost its slot to
+        another context). Order 0 comes last with table None.
+        """
+        contexts = []
+        context_hash = 0
+        history = self.history
+        capacity = self.capacity
+        table_size = self.table_size
+        tags, fills = self.tags, self.fills
+        for k in range(1, len(history) + 1):
+            context_hash = ((context_hash ^ (history[-k] + 1)) *
+                            HASH_MULTIPLIER) & HASH_MASK
+            slot = context_hash % table_size
+            table = k - 1
+            entry = None
+            if tags[table][slot] == context_hash:
+                start = slot * capacity
+                entry = (self.symbols[table], self.counts[table], start,
+                         start + fills[table][slot])
+            contexts.append((table, slot, context_hash, entry))
+        contexts.reverse()
+        contexts.append((None, None, None, (
+            self.order0_symbols, self.order0_counts, 0,
+            len(self.order0_symbols))))
+        return contexts
+
+    def encode(self, coder, symbol: int):
+        contexts = self._contexts()
+        excluded: set = set()
+        for _, _, _, entry in contexts:
+            if entry is None:
+                continue
+            symbols, counts, start, end = entry
+            symbols = symbols[start:end]
+            low = total = distinct = found = 0
+            for sigma, count in zip(symbols, counts[start:end]):
+                if sigma in excluded:
+                    continue
+                if sigma == symbol:
+                    low = total
+                    found = count
+                total += count
+                distinct += 1
+            if not distinct:
+                continue
+            if found:
+                coder.encode_interval(low, low + found, total + distinct)
+                break
+            coder.encode_interval(total, total + distinct, total + distinct)
+            excluded.update(symbols)
+        else:
+            rank = symbol - sum(1 for sigma in excluded if sigma < symbol)
+            coder.encode_interval(rank, rank + 1, self.size - len(excluded))
+        self._update(contexts, symbol)
+
+    def decode(self, coder) -> int:
+        contexts = self._contexts()
+        excluded: set = set()
+        for _, _, _, entry in contexts:
+            if entry is None:
+                continue
+            symbols, counts, start, end = entry
+            symbols = symbols[start:end]
+            candidates = [(sigma, count) for sigma, count
+                          in zip(symbols, counts[start:end])
+                          if sigma not in excluded]
+            if not candidates:
+                continue
+            total = sum(count for _, count in candidates)
+            distinct = len(candidates)
+            target = coder.target(total + distinct)
+            if target < total:
+                low = 0
+                for sigma, count in candidates:
+                    if target < low + count:
+                        break
+                    low += count
+                coder.decode_interval(low, low + count, total + distinct)
+                symbol = sigma
+                break
+            coder.decode_interval(total, total + distinct, total + distinct)
+            excluded.update(symbols)
+        else:
+            rank = coder.target(self.size - len(excluded))
+            coder.decode_interval(rank, rank + 1, self.size - len(excluded))
+            symbol = rank
+            for sigma in sorted(excluded):
+                if sigma <= symbol:
+                    symbol += 1
+        self._update(contexts, symbol)
+        return symbol
+
+    def _update(self, contexts: list, symbol: int):
+        for table, slot, context_hash, entry in contexts:
+            if entry is None:
+                # New context, or one that replaces a colliding context
+                start = slot * self.capacity
+                self.tags[table][slot] = context_hash
+                self.fills[table][slot] = 1
+                self.totals[table][slot] = 1
+                self.symbols[table][start] = symbol
+                self.counts[table][start] = 1
+                continue
+            symbols, counts, start, end = entry
+            if table is None:
+                totals, slot = self.order0_total, 0
+            else:
+                totals = self.totals[table]
+            try:
+                counts[symbols.index(symbol, start, end)] += 1
+            except ValueError:
+                if table is None:
+                    symbols.append(symbol)
+                    counts.append(1)
+                    end += 1
+                elif end - start < self.capacity:
+                    symbols[end] = symbol
+                    counts[end] = 1
+                    self.fills[table][slot] += 1
+                    end += 1
+                else:
+                    # Full slot: the least counted symbol makes way
+                    i = counts.index(min(counts[start:end]), start, end)
+                    totals[slot] -= counts[i]
+                    symbols[i] = symbol
+                    counts[i] = 1
+            total = totals[slot] + 1
+            if total + end - start >= self.max_total:
+                for i in range(start, end):
+                    counts[i] = (counts[i] + 1) // 2
+                total = sum(counts[start:end])
+            totals[slot] = total
+        self.history.append(symbol)
+        if len(self.history) > self.order:
+            del self.history[0]
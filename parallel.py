@@ -0,0 +1,113 @@
+import io
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Deque, Iterable, Iterator, Optional
+
+from container import (
+    DEFAULT_BLOCK_SIZE, ContainerReader, ContainerWriter, CorruptedBlockError,
+    decode_block, encode_block
+)
+
+
+def ordered_map(executor: Optional[Executor], func: Callable,
+                items: Iterable, window: int) -> Iterator:
+    """Like `Executor.map`, but with at most `window` tasks in flight.
+
+    Results come back in input order. Bounding the number of pending tasks
+    keeps memory flat when `items` is a long lazy stream of blocks. Without
+    an executor the calls run inline.
+    """
+    if executor is None:
+        yield from map(func, items)
+        return
+    pending: Deque = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _split(sequence, block_size: int, pickle: bool) -> Iterator:
+    for start in range(0, len(sequence), block_size):
+        block = sequence[start:start + block_size]
+        # Views cannot be pickled over to a worker, so ship a copy
+        if pickle and isinstance(block, memoryview):
+            block = bytes(block)
+        yield block
+
+
+def _encode_task(codec: str, alphabet: Optional[list], params: dict,
+                 block) -> bytes:
+    return encode_block(codec, block, alphabet, params)
+
+
+def _decode_task(codec: str, alphabet: Optional[list], params: dict,
+                 job: tuple) -> Any:
+    payload, length = job
+    try:
+        return decode_block(codec, payload, alphabet, length, params)
+    except (ValueError, IndexError) as e:
+        # Sent back as a value so the parent can name the failing block
+        return e
+
+
+def _executor(workers: int) -> Optional[Executor]:
+    return ProcessPoolExecutor(workers) if workers > 1 else None
+
+
+def parallel_encode(sequence, codec: str = "lz",
+                    alphabet: Optional[list] = None,
+                    block_size: int = DEFAULT_BLOCK_SIZE,
+                    workers: Optional[int] = None, **params) -> bytes:
+    """Code `sequence` as a container, one block per task.
+
+    Blocks are independent, so they are spread over `workers` processes
+    (all cores by default) and written back in order. The output is
+    byte-for-byte the same as `write_container` with the same arguments.
+    """
+    if alphabet is None and isinstance(sequence, str):
+        alphabet = sorted(list(set(sequence)))
+    workers = workers or os.cpu_count() or 1
+    raw = io.BytesIO()
+    writer = ContainerWriter(raw, codec, alphabet, block_size, **params)
+    executor = _executor(workers)
+    try:
+        task = partial(_encode_task, codec, writer.alphabet, params)
+        blocks = _split(sequence, block_size, executor is not None)
+        payloads = ordered_map(executor, task, blocks, 2 * workers)
+        for start, payload in zip(range(0, len(sequence), block_size),
+                                  payloads):
+            length = min(block_size, len(sequence) - start)
+            writer.write_payload(payload, length)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    writer.close()
+    return raw.getvalue()
+
+
+def parallel_decode(data, workers: Optional[int] = None):
+    """Decode a container, one block per task, on `workers` processes."""
+    workers = workers or os.cpu_count() or 1
+    reader = ContainerReader(data)
+    executor = _executor(workers)
+    try:
+        task = partial(_decode_task, reader.codec, reader.alphabet,
+                       reader.params)
+        # Checksums are verified here, before any payload is shipped out
+        jobs = ((bytes(reader.payload(i)), block.length)
+                for i, block in enumerate(reader.blocks))
+        pieces = []
+        for index, decoded in enumerate(
+                ordered_map(executor, task, jobs, 2 * workers)):
+            if isinstance(decoded, Exception):
+                raise CorruptedBlockError(index, str(decoded)) from decoded
+            pieces.append(reader.check_block(index, decoded))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return reader.join(pieces)
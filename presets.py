@@ -0,0 +1,243 @@
+import json
+import struct
+import sys
+from array import array
+from types import MappingProxyType
+from typing import Any, Iterable, List, Optional, Sequence
+
+from arithmetic import ArithmeticDecoder, ArithmeticEncoder
+from lempel_ziv import lz_decode, lz_encode, symbol_array
+from models import MAX_TOTAL, AdaptiveModel
+from utils import (
+    BYTE_ALPHABET, byte_view, calculate_distribution, is_byte_data
+)
+
+# Short records barely compress on their own: LZ78 starts from the empty
+# word and the arithmetic model from uniform counts, so every record pays
+# the whole warm-up again. A preset is trained once on sample records and
+# holds a primed LZ78 wordbook and order-0 priors for the arithmetic model.
+# Encoder and decoder load the same preset and start every record from it.
+#
+# Layout of a preset file:
+#
+#   MAGIC | VERSION (u8) | header length (u32) | header (JSON)
+#   parents: u32 per entry | symbols: u32 alphabet index per entry
+#   priors: u32 per alphabet symbol
+#
+# Entry 0, the empty word, is not stored.
+PRESET_MAGIC = b"AAPS"
+PRESET_VERSION = 1
+PREAMBLE = struct.Struct("<4sBI")
+DEFAULT_PRESET_ENTRIES = 4096
+# Priors add up to about this much, so they outweigh a short record's own
+# counts but the model can still move away from them on a long one
+DEFAULT_PRIOR_TOTAL = 4096
+# Training stops growing its trie at this many times the entries kept
+TRAINING_FACTOR = 16
+
+
+def _u32(values: Iterable[int]) -> bytes:
+    # array('I', bytearray) would read raw bytes, so go value by value
+    data = array('I', iter(values))
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data.tobytes()
+
+
+def _from_u32(data: bytes) -> array:
+    values = array('I')
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class Preset:
+    """A trained LZ78 wordbook and arithmetic priors over `alphabet`.
+
+    Entries are given as parent entry and alphabet index per entry, entry 0
+    being the empty word; parents must come before their children. A preset
+    is shared by every record coded with it and is never changed; codecs
+    copy what they need. `alphabet=None` means byte values.
+    """
+
+    def __init__(self, alphabet: Optional[list], parents: Sequence[int],
+                 symbol_indices: Sequence[int], priors: Sequence[int]):
+        self.alphabet = None if alphabet is None else list(alphabet)
+        symbols_of = BYTE_ALPHABET if alphabet is None else self.alphabet
+        if len(priors) != len(symbols_of):
+            raise ValueError("Preset needs one prior per alphabet symbol.")
+        if len(parents) != len(symbol_indices):
+            raise ValueError("Preset entries need a parent and a symbol.")
+        self.priors = tuple(priors)
+        self.parents = array('I', [0])
+        self.lengths = array('I', [0])
+        self.symbol_indices = symbol_array(symbols_of)
+        self.symbol_indices.append(0)
+        self.child_counts = array('I', [0])
+        children = {}
+        for parent, index in zip(parents, symbol_indices):
+            entry = len(self.parents)
+            if parent >= entry or index >= len(symbols_of):
+                raise ValueError("Corrupted preset: entry out of range.")
+            symbol = symbols_of[index]
+            if (parent, symbol) in children:
+                raise ValueError("Corrupted preset: duplicate entry.")
+            children[(parent, symbol)] = entry
+            self.parents.append(parent)
+            self.lengths.append(self.lengths[parent] + 1)
+            self.symbol_indices.append(index)
+            self.child_counts.append(0)
+            self.child_counts[parent] += 1
+        self.children = MappingProxyType(children)
+
+    def __len__(self) -> int:
+        """Entries in the wordbook, the empty word included."""
+        return len(self.parents)
+
+    def model(self, max_total: int = MAX_TOTAL,
+              increment: int = 1) -> AdaptiveModel:
+        """A fresh adaptive model starting from the trained priors."""
+        return AdaptiveModel(len(self.priors), max_total, increment,
+                             counts=self.priors)
+
+    def dumps(self) -> bytes:
+        header = json.dumps({
+            "alphabet": self.alphabet,
+            "entries": len(self) - 1,
+        }).encode("utf-8")
+        return (PREAMBLE.pack(PRESET_MAGIC, PRESET_VERSION, len(header))
+                + header + _u32(self.parents[1:])
+                + _u32(self.symbol_indices[1:])
+                + _u32(self.priors))
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            f.write(self.dumps())
+
+
+def loads(data: bytes) -> Preset:
+    data = memoryview(data).cast("B")
+    if len(data) < PREAMBLE.size:
+        raise ValueError("Corrupted preset: file is too short.")
+    magic, version, header_size = PREAMBLE.unpack_from(data)
+    if magic != PRESET_MAGIC:
+        raise ValueError("Not a preset file.")
+    if version != PRESET_VERSION:
+        raise ValueError(f"Unsupported preset version: {version}")
+    start = PREAMBLE.size + header_size
+    try:
+        header = json.loads(bytes(data[PREAMBLE.size:start]))
+    except ValueError as e:
+        raise ValueError(f"Corrupted preset: bad header ({e}).") from e
+    alphabet = header["alphabet"]
+    entries = header["entries"]
+    symbol_count = len(BYTE_ALPHABET if alphabet is None else alphabet)
+    end = start + 4 * (2 * entries + symbol_count)
+    if len(data) != end:
+        raise ValueError("Corrupted preset: wrong size.")
+    middle = start + 4 * entries
+    return Preset(alphabet, _from_u32(data[start:middle]),
+                  _from_u32(data[middle:middle + 4 * entries]),
+                  _from_u32(data[middle + 4 * entries:end]))
+
+
+def load_preset(path: str) -> Preset:
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def train_preset(samples: Iterable, alphabet: Optional[list] = None,
+                 entries: int = DEFAULT_PRESET_ENTRIES,
+                 prior_total: int = DEFAULT_PRIOR_TOTAL) -> Preset:
+    """Build a preset from sample records.
+
+    Every sample is parsed with LZ78 into one shared trie, counting how
+    often each word is passed through, and the `entries` most used words
+    are kept. A word is always used more often than the longer words
+    built on it, so the words kept include all of their prefixes. Priors
+    are the samples' symbol distribution scaled to `prior_total`.
+
+    Text samples take the sorted symbols they contain as alphabet unless
+    one is given; bytes-like samples use byte values.
+    """
+    samples = list(samples)
+    byte_mode = bool(samples) and is_byte_data(samples[0])
+    if alphabet is None and not byte_mode:
+        alphabet = sorted(set().union(*samples))
+    symbols_of = BYTE_ALPHABET if byte_mode else alphabet
+
+    parents = [0]
+    symbols: List[Any] = [None]
+    visits = [0]
+    children = {}
+    limit = TRAINING_FACTOR * entries
+    for sample in samples:
+        if byte_mode:
+            sample = byte_view(sample)
+        node = 0
+        for symbol in sample:
+            child = children.get((node, symbol))
+            if child is not None:
+                visits[child] += 1
+                node = child
+                continue
+            if len(parents) < limit:
+                children[(node, symbol)] = len(parents)
+                parents.append(node)
+                symbols.append(symbol)
+                visits.append(1)
+            node = 0
+
+    # Most used first; ties go to the shorter word and then to the older
+    # one, which keeps the order the same from run to run
+    depth = [0] * len(parents)
+    for node in range(1, len(parents)):
+        depth[node] = depth[parents[node]] + 1
+    kept = sorted(range(1, len(parents)),
+                  key=lambda node: (-visits[node], depth[node], node))
+    kept = sorted(kept[:entries - 1], key=lambda node: (depth[node], node))
+    renumber = {0: 0}
+    for node in kept:
+        renumber[node] = len(renumber)
+    index_of = {symbol: i for i, symbol in enumerate(symbols_of)}
+
+    joined = b"".join(samples) if byte_mode else "".join(samples)
+    distribution = calculate_distribution(joined) if joined else {}
+    priors = [max(1, round(distribution.get(symbol, 0) * prior_total))
+              for symbol in symbols_of]
+    return Preset(None if byte_mode else alphabet,
+                  [renumber[parents[node]] for node in kept],
+                  [index_of[symbols[node]] for node in kept], priors)
+
+
+PRESET_CODECS = ("lz", "arithmetic")
+
+
+def preset_encode(sequence, preset: Preset, codec: str = "lz",
+                  max_entries: Optional[int] = None,
+                  policy: str = "reset") -> bytes:
+    """Code one record starting from `preset`, with its alphabet."""
+    if codec == "lz":
+        return lz_encode(sequence, preset.alphabet, max_entries, policy,
+                         preset)
+    if codec == "arithmetic":
+        encoder = ArithmeticEncoder(preset.alphabet, preset.model())
+        return encoder.feed(sequence) + encoder.flush()
+    raise ValueError(f"Unknown preset codec: {codec!r}")
+
+
+def preset_decode(encoded: bytes, preset: Preset, length: int,
+                  codec: str = "lz", max_entries: Optional[int] = None,
+                  policy: str = "reset"):
+    """Decode a record coded by `preset_encode` with the same preset.
+
+    `length` is only needed by the arithmetic codec.
+    """
+    if codec == "lz":
+        return lz_decode(encoded, preset.alphabet, max_entries, policy,
+                         preset)
+    if codec == "arithmetic":
+        decoder = ArithmeticDecoder(preset.alphabet, length, preset.model())
+        return decoder.feed(encoded) + decoder.flush()
+    raise ValueError(f"Unknown preset codec: {codec!r}")
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from math import ceil, log2
+from typing import Any, Callable, NamedTuple, Optional
+
+from bitstream import payload_bit_length
+from utils import byte_view, calculate_entropy, is_byte_data
+
+
+class EncodeResult(NamedTuple):
+    """Everything one encoding pass found out about its input."""
+    payload: bytes
+    length: int
+    bits: int
+    original_bits: int
+    entropy: float
+    seconds: float
+
+    @property
+    def efficiency(self) -> float:
+        """Coded bits over the bits of a fixed-width code for the input."""
+        return self.bits / self.original_bits if self.original_bits else 0.0
+
+    @property
+    def bits_per_symbol(self) -> float:
+        return self.bits / self.length if self.length else 0.0
+
+
+class ResultCache:
+    """LRU cache of encode results, keyed by a hash of the input and of
+    the settings it was coded with.
+
+    Holds at most `max_entries` results and `max_bytes` bytes of payload;
+    the least recently used results go first.
+    """
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 64 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.results: "OrderedDict[bytes, EncodeResult]" = OrderedDict()
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    @staticmethod
+    def key(sequence, *settings: Any) -> bytes:
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(json.dumps(settings, default=repr).encode("utf-8"))
+        # Text and bytes with the same content must not share an entry
+        if is_byte_data(sequence):
+            digest.update(b"b")
+            digest.update(byte_view(sequence))
+        else:
+            digest.update(b"s")
+            digest.update(sequence.encode("utf-8", "surrogatepass"))
+        return digest.digest()
+
+    def get(self, key: bytes) -> Optional[EncodeResult]:
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.results.move_to_end(key)
+        return result
+
+    def put(self, key: bytes, result: EncodeResult):
+        if len(result.payload) > self.max_bytes:
+            return
+        old = self.results.pop(key, None)
+        if old is not None:
+            self.size -= len(old.payload)
+        self.results[key] = result
+        self.size += len(result.payload)
+        while len(self.results) > self.max_entries or \
+                self.size > self.max_bytes:
+            _, evicted = self.results.popitem(last=False)
+            self.size -= len(evicted.payload)
+
+    def clear(self):
+        self.results.clear()
+        self.size = 0
+
+
+def encode_with_stats(encode: Callable[[], bytes], sequence, alphabet,
+                      cache: Optional[ResultCache] = None,
+                      settings: tuple = ()) -> EncodeResult:
+    """Run `encode` once and measure its output against `sequence`.
+
+    With a cache, inputs already coded with the same `settings` are not
+    coded again.
+    """
+    if cache is not None:
+        key = cache.key(sequence, *settings)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    start = time.perf_counter()
+    payload = encode()
+    seconds = time.perf_counter() - start
+    result = EncodeResult(
+        payload=payload,
+        length=len(sequence),
+        bits=payload_bit_length(payload),
+        original_bits=len(sequence) * max(1, ceil(log2(len(alphabet)))),
+        entropy=calculate_entropy(sequence),
+        seconds=seconds,
+    )
+    if cache is not None:
+        cache.put(key, result)
+    return result
@@ -0,0 +1,312 @@
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import (
+    Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+)
+
+from instrumentation import metrics
+from utils import byte_view, calculate_entropy, is_byte_data
+
+# Picks a codec for every block on its own. A block is first estimated
+# cheaply: the order-0 entropy and the density of repeated k-grams of a
+# sample, then each candidate codec is tried on a prefix. A codec's ratio on
+# a prefix overstates its ratio on the whole block (LZ dictionaries and
+# adaptive models start out empty), so the trial ratio is the one on the
+# prefix's second half: the growth in output from coding half the prefix
+# to coding all of it. The block is coded
+# with the candidate that did best, or stored as it is when nothing beats
+# that. The payload starts with one byte naming the codec it was coded with,
+# so the choice travels with the block.
+AUTO_CODECS = ("stored", "lz", "arithmetic", "lzss", "lzw", "hybrid",
+               "context")
+DEFAULT_CANDIDATES = ("lz", "arithmetic")
+# Symbols each candidate is tried on; blocks up to twice this are coded in
+# full by every candidate instead. Smaller trials are raised to the
+# minimum, below which the second half is too short to measure.
+DEFAULT_TRIAL_SIZE = 8192
+MIN_TRIAL_SIZE = 1024
+SAMPLE_SIZE = 4096
+SAMPLE_PIECES = 4
+REPEAT_ORDER = 4
+# A sample this close to the stored size's bits per symbol, with this few
+# repeats, is stored without trying any codec
+STORED_ENTROPY = 0.97
+STORED_REPEATS = 0.05
+
+CodecTable = Dict[str, Tuple[Callable, Callable]]
+# Codec -> factory(alphabet, params) of an encoder with feed and flush
+StreamTable = Dict[str, Callable]
+
+
+class BlockEstimate(NamedTuple):
+    entropy: float
+    repeats: float
+    # Candidate -> (trial size over stored size, trial seconds)
+    trials: Dict[str, Tuple[float, float]]
+    seconds: float
+
+
+class BlockChoice(NamedTuple):
+    codec: str
+    length: int
+    stored_size: int
+    size: int
+    estimate: BlockEstimate
+    seconds: float
+
+    @property
+    def ratio(self) -> float:
+        return self.size / self.stored_size if self.stored_size else 1.0
+
+
+def store(sequence) -> bytes:
+    if is_byte_data(sequence):
+        return bytes(byte_view(sequence))
+    return sequence.encode("utf-8")
+
+
+def unstore(payload, alphabet: Optional[list]):
+    if alphabet is None:
+        return bytes(payload)
+    return bytes(payload).decode("utf-8")
+
+
+def sample(sequence, size: int = SAMPLE_SIZE, pieces: int = SAMPLE_PIECES):
+    """Evenly spaced slices of `sequence`, `size` symbols in all."""
+    if is_byte_data(sequence):
+        # Copied, so its k-grams can be hashed
+        sequence = byte_view(sequence)
+        if len(sequence) <= size:
+            return bytes(sequence)
+    elif len(sequence) <= size:
+        return sequence
+    piece = size // pieces
+    stride = (len(sequence) - piece) // (pieces - 1)
+    parts = [sequence[i * stride:i * stride + piece] for i in range(pieces)]
+    if isinstance(sequence, str):
+        return "".join(parts)
+    return b"".join(parts)
+
+
+def repeat_density(sequence, order: int = REPEAT_ORDER) -> float:
+    """Fraction of the `order`-grams of `sequence` seen earlier in it."""
+    count = len(sequence) - order + 1
+    if count <= 0:
+        return 0.0
+    seen = set()
+    repeats = 0
+    for i in range(count):
+        gram = sequence[i:i + order]
+        if gram in seen:
+            repeats += 1
+        else:
+            seen.add(gram)
+    return repeats / count
+
+
+def estimate_block(codecs: CodecTable, sequence, alphabet: Optional[list],
+                   params: Dict[str, Any],
+                   streams: Optional[StreamTable] = None) -> BlockEstimate:
+    return _estimate(codecs, sequence, alphabet, params, streams)[0]
+
+
+def _estimate(codecs: CodecTable, sequence, alphabet: Optional[list],
+              params: Dict[str, Any], streams: Optional[StreamTable] = None
+              ) -> Tuple[BlockEstimate, Dict[str, Tuple[Callable, float]]]:
+    # Also returns, per candidate tried, a function giving its payload for
+    # the whole block without starting over, and the trial seconds that
+    # work saves
+    start = time.perf_counter()
+    streams = streams or {}
+    picked = sample(sequence)
+    entropy = calculate_entropy(picked)
+    repeats = repeat_density(picked)
+    stored_bits = 8 * len(store(picked)) / len(picked) if len(picked) else 8
+    trials: Dict[str, Tuple[float, float]] = {}
+    finish: Dict[str, Tuple[Callable, float]] = {}
+    if entropy < STORED_ENTROPY * stored_bits or repeats >= STORED_REPEATS:
+        trial_size = max(params.get("trial_size", DEFAULT_TRIAL_SIZE),
+                         MIN_TRIAL_SIZE)
+        whole = len(sequence) <= 2 * trial_size
+        for codec in params.get("candidates", DEFAULT_CANDIDATES):
+            encode = codecs[codec][0]
+            began = time.perf_counter()
+            if whole:
+                payload = encode(sequence, alphabet, params)
+                ratio = len(payload) / max(1, len(store(sequence)))
+                seconds = time.perf_counter() - began
+                finish[codec] = (lambda payload=payload: payload, seconds)
+            else:
+                ratio = _trial_ratio(encode, streams.get(codec), sequence,
+                                     trial_size, alphabet, params, finish,
+                                     codec, began)
+                seconds = time.perf_counter() - began
+            trials[codec] = (ratio, seconds)
+    return BlockEstimate(entropy, repeats, trials,
+                         time.perf_counter() - start), finish
+
+
+def _trial_ratio(encode: Callable, stream: Optional[Callable], sequence,
+                 trial_size: int, alphabet: Optional[list],
+                 params: Dict[str, Any],
+                 finish: Dict[str, Tuple[Callable, float]], codec: str,
+                 began: float) -> float:
+    half = sequence[:trial_size // 2]
+    second = sequence[trial_size // 2:trial_size]
+    prefix = sequence[:trial_size]
+    if stream is not None:
+        # Coded once: what the second half adds is what the encoder puts
+        # out while it is fed. The encoder is kept, so the rest of the
+        # block can follow if this codec is chosen.
+        encoder = stream(alphabet, params)
+        pieces = [encoder.feed(half), encoder.feed(second)]
+        grown = len(pieces[1])
+        finish[codec] = (
+            lambda: b"".join(pieces) + encoder.feed(
+                sequence[trial_size:]) + encoder.flush(),
+            time.perf_counter() - began)
+    else:
+        grown = len(encode(prefix, alphabet, params)) - \
+            len(encode(half, alphabet, params))
+    stored = len(store(second))
+    if grown <= 0 or stored <= 0:
+        # Nothing to measure a margin on; judge the prefix as a whole
+        return len(encode(prefix, alphabet, params)) / \
+            max(1, len(store(prefix)))
+    return grown / stored
+
+
+def choose_codec(estimate: BlockEstimate, tolerance: float = 0.0) -> str:
+    """The candidate with the smallest trial output, or "stored" when none
+    shrinks the data. With a `tolerance`, the fastest candidate whose ratio
+    is within that much of the best is taken instead.
+    """
+    if not estimate.trials:
+        return "stored"
+    best = min(ratio for ratio, _ in estimate.trials.values())
+    if best >= 1.0:
+        return "stored"
+    close = [(seconds, codec) for codec, (ratio, seconds)
+             in estimate.trials.items() if ratio <= best + tolerance]
+    return min(close)[1]
+
+
+def check_candidates(candidates) -> List[str]:
+    candidates = list(candidates)
+    for codec in candidates:
+        if codec not in AUTO_CODECS or codec == "stored":
+            raise ValueError(f"Codec {codec!r} cannot be scheduled.")
+    return candidates
+
+
+def auto_encode(codecs: CodecTable, sequence, alphabet: Optional[list],
+                params: Dict[str, Any],
+                streams: Optional[StreamTable] = None
+                ) -> Tuple[bytes, BlockChoice]:
+    """Code one block with the codec estimated to suit it best.
+
+    Returns the payload, its first byte naming the codec, and the choice
+    made with what it was based on. A block is never coded larger than
+    storing it, plus the codec byte. Candidates with an encoder in
+    `streams` are tried without coding their trial twice, and the chosen
+    one goes on from where its trial stopped.
+    """
+    check_candidates(params.get("candidates", DEFAULT_CANDIDATES))
+    start = time.perf_counter()
+    stored = store(sequence)
+    estimate, finish = _estimate(codecs, sequence, alphabet, params,
+                                 streams)
+    codec = choose_codec(estimate, params.get("tolerance", 0.0))
+    payload = stored
+    if codec != "stored":
+        if codec in finish:
+            complete, reused = finish[codec]
+            coded = complete()
+            # That trial went into the payload rather than being spent on
+            # estimating
+            estimate = estimate._replace(seconds=estimate.seconds - reused)
+        else:
+            coded = codecs[codec][0](sequence, alphabet, params)
+        if len(coded) < len(stored):
+            payload = coded
+        else:
+            codec = "stored"
+    choice = BlockChoice(codec, len(sequence), len(stored), len(payload) + 1,
+                         estimate, time.perf_counter() - start)
+    return bytes([AUTO_CODECS.index(codec)]) + payload, choice
+
+
+def block_codec(payload) -> str:
+    """The codec an auto-coded block was coded with."""
+    if not len(payload) or payload[0] >= len(AUTO_CODECS):
+        raise ValueError("Corrupted encoded data: unknown block codec.")
+    return AUTO_CODECS[payload[0]]
+
+
+def auto_decode(codecs: CodecTable, payload, alphabet: Optional[list],
+                length: int, params: Dict[str, Any]):
+    codec = block_codec(payload)
+    body = memoryview(payload)[1:]
+    if codec == "stored":
+        return unstore(body, alphabet)
+    return codecs[codec][1](body, alphabet, length, params)
+
+
+class ScheduleReport:
+    """What the scheduler chose for each block and what it cost.
+
+    Gather choices from a run with `collect`; blocks must be coded in this
+    process with metrics enabled.
+    """
+
+    def __init__(self):
+        self.choices: List[BlockChoice] = []
+
+    def add(self, choice: BlockChoice):
+        self.choices.append(choice)
+
+    def _on_event(self, event: str, fields: Dict[str, Any]):
+        if event == "auto.block":
+            self.add(fields["choice"])
+
+    @contextmanager
+    def collect(self) -> Iterator["ScheduleReport"]:
+        metrics.subscribe(self._on_event)
+        try:
+            with metrics.collect():
+                yield self
+        finally:
+            metrics.unsubscribe(self._on_event)
+
+    def totals(self) -> Dict[str, Dict[str, float]]:
+        totals: Dict[str, Counter] = {}
+        for choice in self.choices:
+            total = totals.setdefault(choice.codec, Counter())
+            total["blocks"] += 1
+            total["stored_bytes"] += choice.stored_size
+            total["bytes"] += choice.size
+            total["seconds"] += choice.seconds
+            total["estimate_seconds"] += choice.estimate.seconds
+        return {codec: dict(total) for codec, total in totals.items()}
+
+    def lines(self) -> List[str]:
+        lines = []
+        stored = size = seconds = estimating = 0
+        for codec, total in sorted(self.totals().items()):
+            lines.append(
+                f"{codec:>10}: {total['blocks']:>5} blocks "
+                f"{total['stored_bytes']:>12,} -> {total['bytes']:>12,} bytes "
+                f"(ratio {total['bytes'] / total['stored_bytes']:.3f}) "
+                f"in {total['seconds']:.2f}s")
+            stored += total["stored_bytes"]
+            size += total["bytes"]
+            seconds += total["seconds"]
+            estimating += total["estimate_seconds"]
+        if stored:
+            lines.append(
+                f"{'total':>10}: {len(self.choices):>5} blocks "
+                f"{stored:>12,} -> {size:>12,} bytes "
+                f"(ratio {size / stored:.3f}) in {seconds:.2f}s, "
+                f"{estimating / seconds:.0%} of it estimating")
+        return lines
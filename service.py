@@ -0,0 +1,517 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from container import CODECS, decode_block, encode_block
+
+# A local compression tier: an asyncio server that runs encode and decode
+# requests for any container codec on a process pool, so callers no longer
+# spend their own time in the pure-Python codecs.
+#
+# Every message, either way, is one frame:
+#
+#   header length (u32) | payload length (u32) | header (JSON) | payload
+#
+# Request headers hold "id", "op" ("encode" or "decode"), "codec",
+# "alphabet", "params", "text" (the data is UTF-8 text rather than bytes)
+# and, for decoding, "length". Responses carry the same "id" with either
+# "ok": true and the coded payload, or "ok": false and an "error" message.
+# A connection may have many requests in flight; responses come back as
+# they finish, not necessarily in order.
+#
+# Small requests are grouped into one pool task per batch, so a flood of
+# tiny messages does not pay a process round trip each. Requests wait in a
+# bounded queue; once it is full the server stops reading from sockets and
+# TCP pushes back on the producers.
+FRAME = struct.Struct("<II")
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_BATCH_BYTES = 256 * 1024
+DEFAULT_BATCH_DELAY = 0.002
+DEFAULT_MAX_PENDING = 64
+MAX_FRAME_BYTES = 64 << 20
+
+
+class ServiceError(ValueError):
+    """A request the service could not carry out."""
+
+
+class Job:
+    """One request waiting in the queue, and where its answer goes."""
+
+    def __init__(self, header: Dict[str, Any], payload: bytes,
+                 future: asyncio.Future):
+        self.header = header
+        self.payload = payload
+        self.future = future
+
+    def task(self) -> tuple:
+        header = self.header
+        return (header.get("op"), header.get("codec", "lz"),
+                header.get("alphabet"), header.get("length", 0),
+                header.get("params") or {}, bool(header.get("text")),
+                self.payload)
+
+
+OPERATIONS = ("encode", "decode")
+
+
+def check_request(header: Dict[str, Any]):
+    """Reject a request header the workers could not run, before it is
+    queued."""
+    op = header.get("op")
+    if op not in OPERATIONS:
+        raise ServiceError(f"Unknown operation: {op!r}")
+    codec = header.get("codec", "lz")
+    if not isinstance(codec, str) or codec not in CODECS:
+        raise ServiceError(f"Unknown codec: {codec!r}")
+    alphabet = header.get("alphabet")
+    if alphabet is not None and not isinstance(alphabet, list):
+        raise ServiceError("Alphabet must be a list.")
+    params = header.get("params")
+    if params is not None and not isinstance(params, dict):
+        raise ServiceError("Params must be an object.")
+    length = header.get("length", 0)
+    if not isinstance(length, int) or length < 0:
+        raise ServiceError("Length must be a non-negative integer.")
+
+
+def _run_job(op: str, codec: str, alphabet: Optional[list], length: int,
+             params: Dict[str, Any], text: bool,
+             payload: bytes) -> Tuple[bytes, int, bool]:
+    if codec not in CODECS:
+        raise ServiceError(f"Unknown codec: {codec!r}")
+    if op == "encode":
+        sequence = payload.decode("utf-8") if text else payload
+        if text and alphabet is None:
+            alphabet = sorted(set(sequence))
+        return encode_block(codec, sequence, alphabet, params), \
+            len(sequence), False
+    if op == "decode":
+        decoded = decode_block(codec, payload, alphabet, length, params)
+        if isinstance(decoded, str):
+            return decoded.encode("utf-8"), len(decoded), True
+        return bytes(decoded), len(decoded), False
+    raise ServiceError(f"Unknown operation: {op!r}")
+
+
+def _run_batch(tasks: List[tuple]) -> List[tuple]:
+    """Run a batch in a worker process; one bad request does not fail the
+    others, its error is sent back in its place.
+    """
+    results = []
+    for task in tasks:
+        try:
+            results.append((True,) + _run_job(*task))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}"))
+    return results
+
+
+async def read_frame(reader: asyncio.StreamReader,
+                     max_bytes: int = MAX_FRAME_BYTES
+                     ) -> Optional[Tuple[Dict[str, Any], bytes]]:
+    """The next frame on `reader`, or None once the peer has closed."""
+    try:
+        prefix = await reader.readexactly(FRAME.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ServiceError("Connection closed inside a frame.") from e
+        return None
+    header_size, payload_size = FRAME.unpack(prefix)
+    if header_size + payload_size > max_bytes:
+        raise ServiceError(
+            f"Frame of {header_size + payload_size} bytes is over the "
+            f"{max_bytes} byte limit.")
+    try:
+        header = json.loads(await reader.readexactly(header_size))
+        payload = await reader.readexactly(payload_size)
+    except asyncio.IncompleteReadError as e:
+        raise ServiceError("Connection closed inside a frame.") from e
+    except ValueError as e:
+        raise ServiceError(f"Bad frame header: {e}") from e
+    if not isinstance(header, dict):
+        raise ServiceError(
+            f"Bad frame header: expected an object, got "
+            f"{type(header).__name__}")
+    return header, payload
+
+
+def write_frame(writer: asyncio.StreamWriter, header: Dict[str, Any],
+                payload: bytes = b""):
+    encoded = json.dumps(header).encode("utf-8")
+    # One write, so frames from concurrent tasks never interleave
+    writer.write(FRAME.pack(len(encoded), len(payload)) + encoded + payload)
+
+
+class CompressionServer:
+    """Serves encode and decode requests from a process pool.
+
+    Requests are pulled off a queue of at most `queue_size` entries and
+    sent to the pool in batches of up to `batch_size` requests or
+    `batch_bytes` bytes, whichever fills first; a batch waits at most
+    `batch_delay` seconds for more requests to join it. Each connection
+    may have up to `max_pending` requests in flight.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 workers: Optional[int] = None,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 batch_bytes: int = DEFAULT_BATCH_BYTES,
+                 batch_delay: float = DEFAULT_BATCH_DELAY,
+                 max_pending: int = DEFAULT_MAX_PENDING):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.batch_delay = batch_delay
+        self.max_pending = max_pending
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.batcher: Optional[asyncio.Task] = None
+        self.handlers: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        # Requests and batches handled, for monitoring
+        self.requests = 0
+        self.batches = 0
+
+    async def start(self):
+        self.executor = ProcessPoolExecutor(self.workers)
+        self.queue = asyncio.Queue(self.queue_size)
+        # Two batches per worker keeps the pool busy while the next one
+        # is gathered, without letting work pile up in the executor
+        self.slots = asyncio.Semaphore(2 * self.workers)
+        self.batcher = asyncio.create_task(self._batch_loop())
+        self.server = await asyncio.start_server(
+            self._handle, self.host, self.port)
+        if self.port == 0:
+            self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+        tasks = list(self.handlers)
+        for task, writer in self.handlers.items():
+            writer.close()
+            task.cancel()
+        if self.batcher is not None:
+            self.batcher.cancel()
+            tasks.append(self.batcher)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def __aenter__(self) -> "CompressionServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter):
+        pending = asyncio.Semaphore(self.max_pending)
+        replies = set()
+        handler = asyncio.current_task()
+        self.handlers[handler] = writer
+        try:
+            while True:
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                header, payload = frame
+                try:
+                    check_request(header)
+                except ServiceError as e:
+                    # Answered here; the connection stays usable
+                    write_frame(writer, {"id": header.get("id"), "ok": False,
+                                         "error": f"ServiceError: {e}"})
+                    await writer.drain()
+                    continue
+                await pending.acquire()
+                future = asyncio.get_running_loop().create_future()
+                # Blocks while the queue is full, which stops this socket
+                # being read until the pool catches up
+                await self.queue.put(Job(header, payload, future))
+                reply = asyncio.create_task(
+                    self._reply(writer, header.get("id"), future, pending))
+                replies.add(reply)
+                reply.add_done_callback(replies.discard)
+            if replies:
+                await asyncio.gather(*replies)
+        except ServiceError as e:
+            write_frame(writer, {"id": None, "ok": False, "error": str(e)})
+        except ConnectionError:
+            pass
+        except asyncio.CancelledError:
+            # Shutting down; nothing is left to answer to
+            for reply in replies:
+                reply.cancel()
+        finally:
+            del self.handlers[handler]
+            writer.close()
+
+    async def _reply(self, writer: asyncio.StreamWriter, request_id,
+                     future: asyncio.Future, pending: asyncio.Semaphore):
+        try:
+            result = await future
+            if result[0]:
+                _, payload, length, text = result
+                write_frame(writer, {"id": request_id, "ok": True,
+                                     "length": length, "text": text},
+                            payload)
+            else:
+                write_frame(writer, {"id": request_id, "ok": False,
+                                     "error": result[1]})
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            pending.release()
+
+    def _fill(self, batch: List[Job], size: int) -> int:
+        while (len(batch) < self.batch_size and size < self.batch_bytes
+               and not self.queue.empty()):
+            job = self.queue.get_nowait()
+            batch.append(job)
+            size += len(job.payload)
+        return size
+
+    async def _next_batch(self) -> List[Job]:
+        batch = [await self.queue.get()]
+        size = self._fill(batch, len(batch[0].payload))
+        if (len(batch) < self.batch_size and size < self.batch_bytes
+                and self.batch_delay > 0):
+            # Give requests that are on their way a moment to join
+            await asyncio.sleep(self.batch_delay)
+            self._fill(batch, size)
+        return batch
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            await self.slots.acquire()
+            future = loop.run_in_executor(
+                self.executor, _run_batch, [job.task() for job in batch])
+            future.add_done_callback(
+                lambda done, batch=batch: self._finish_batch(batch, done))
+            self.requests += len(batch)
+            self.batches += 1
+
+    def _finish_batch(self, batch: List[Job], done: asyncio.Future):
+        self.slots.release()
+        if done.cancelled():
+            results = [(False, "Server is shutting down.")] * len(batch)
+        elif done.exception() is not None:
+            # The worker itself died; every request in it failed
+            results = [(False, f"Worker failed: {done.exception()}")] \
+                * len(batch)
+        else:
+            results = done.result()
+        for job, result in zip(batch, results):
+            if not job.future.done():
+                job.future.set_result(result)
+
+
+class ServiceConnection:
+    """One persistent connection to a `CompressionServer`.
+
+    Requests are pipelined: any number may be in flight at once, and each
+    caller is woken when the response with its id arrives.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count()
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.listener = asyncio.create_task(self._listen())
+
+    @classmethod
+    async def open(cls, host: str = DEFAULT_HOST,
+                   port: int = DEFAULT_PORT) -> "ServiceConnection":
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    @property
+    def closed(self) -> bool:
+        return self.listener.done()
+
+    async def _listen(self):
+        error: Exception = ServiceError("Connection closed by the server.")
+        try:
+            while True:
+                frame = await read_frame(self.reader)
+                if frame is None:
+                    break
+                header, payload = frame
+                future = self.pending.pop(header.get("id"), None)
+                if future is None:
+                    # Only a whole-connection failure has no id
+                    error = ServiceError(header.get("error", "Bad reply."))
+                    break
+                if not future.done():
+                    future.set_result((header, payload))
+        except (ServiceError, ConnectionError) as e:
+            error = e
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.pending.clear()
+
+    async def request(self, header: Dict[str, Any],
+                      payload: bytes) -> Tuple[Dict[str, Any], bytes]:
+        if self.closed:
+            raise ServiceError("Connection is closed.")
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        write_frame(self.writer, dict(header, id=request_id), payload)
+        await self.writer.drain()
+        reply, data = await future
+        if not reply.get("ok"):
+            raise ServiceError(reply.get("error", "Request failed."))
+        return reply, data
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self.listener
+
+
+class ServiceClient:
+    """Client for a `CompressionServer` over a small pool of connections.
+
+    Connections are opened on first use and requests are spread over them
+    in turn; a connection the server dropped is replaced on the next
+    request. Failed requests raise `ServiceError`, a ValueError like the
+    in-process codecs raise for bad input.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 connections: int = 4):
+        self.host = host
+        self.port = port
+        self.connections: List[Optional[ServiceConnection]] = \
+            [None] * connections
+        self.turn = itertools.cycle(range(connections))
+        self.lock = asyncio.Lock()
+
+    async def _connection(self) -> ServiceConnection:
+        slot = next(self.turn)
+        async with self.lock:
+            connection = self.connections[slot]
+            if connection is None or connection.closed:
+                connection = await ServiceConnection.open(self.host,
+                                                          self.port)
+                self.connections[slot] = connection
+        return connection
+
+    async def encode(self, sequence, codec: str = "lz",
+                     alphabet: Optional[list] = None, **params) -> bytes:
+        """Code `sequence` like `container.encode_block` would.
+
+        Text is sent as UTF-8; without an alphabet its sorted symbols are
+        used, as `parallel_encode` does, and must be given again to decode.
+        """
+        text = isinstance(sequence, str)
+        if text and alphabet is None:
+            alphabet = sorted(set(sequence))
+        payload = sequence.encode("utf-8") if text else bytes(sequence)
+        connection = await self._connection()
+        _, encoded = await connection.request(
+            {"op": "encode", "codec": codec, "alphabet": alphabet,
+             "params": params, "text": text}, payload)
+        return encoded
+
+    async def decode(self, encoded: bytes, length: int, codec: str = "lz",
+                     alphabet: Optional[list] = None, **params):
+        """Decode `encoded` back to `length` symbols, as
+        `container.decode_block` would; returns text with an alphabet,
+        else bytes.
+        """
+        connection = await self._connection()
+        reply, data = await connection.request(
+            {"op": "decode", "codec": codec, "alphabet": alphabet,
+             "length": length, "params": params}, bytes(encoded))
+        return data.decode("utf-8") if reply.get("text") else data
+
+    async def close(self):
+        for connection in self.connections:
+            if connection is not None:
+                await connection.close()
+        self.connections = [None] * len(self.connections)
+
+    async def __aenter__(self) -> "ServiceClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="service.py",
+        description="Serve encode and decode requests for every container "
+                    "codec from a pool of worker processes.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-j", "--workers", type=int,
+                        default=os.cpu_count() or 1,
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="requests waiting before producers are held "
+                             "back")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="most requests sent to a worker at once")
+    parser.add_argument("--batch-bytes", type=int,
+                        default=DEFAULT_BATCH_BYTES,
+                        help="most request bytes sent to a worker at once")
+    parser.add_argument("--batch-delay", type=float,
+                        default=DEFAULT_BATCH_DELAY,
+                        help="seconds a batch waits for more requests")
+    return parser
+
+
+async def serve(args: argparse.Namespace):
+    server = CompressionServer(args.host, args.port, args.workers,
+                               args.queue_size, args.batch_size,
+                               args.batch_bytes, args.batch_delay)
+    async with server:
+        print(f"Serving on {server.host}:{server.port} with {server.workers} "
+              f"workers", file=sys.stderr)
+        await server.serve_forever()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    try:
+        asyncio.run(serve(build_parser().parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
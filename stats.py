@@ -0,0 +1,176 @@
+import argparse
+import sys
+from collections import deque
+from typing import IO, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+
+from utils import byte_view
+
+# Byte statistics computed with NumPy instead of one symbol at a time, to
+# judge how compressible an input is without running a codec over it.
+# Entropies are empirical, in bits per byte: order 0 from the byte
+# histogram, order 1 from the histogram of adjacent byte pairs, as the
+# entropy of a byte given the one before it.
+
+DEFAULT_WINDOW = 1 << 20
+
+
+def as_bytes(data) -> np.ndarray:
+    """A uint8 array over the bytes of `data`, without copying."""
+    return np.frombuffer(byte_view(data), dtype=np.uint8)
+
+
+def byte_histogram(data) -> np.ndarray:
+    """Count of every byte value, as 256 int64s."""
+    return np.bincount(as_bytes(data), minlength=256)
+
+
+def pair_histogram(data, previous: Optional[int] = None) -> np.ndarray:
+    """Counts of adjacent byte pairs, indexed ``[previous, current]``.
+
+    `previous` is the byte before `data`, so a stream split into pieces
+    counts the pairs across the cuts too.
+    """
+    values = as_bytes(data)
+    if previous is not None and len(values):
+        values = np.concatenate(([previous], values)).astype(np.uint8)
+    pairs = (values[:-1].astype(np.uint16) << 8) | values[1:]
+    return np.bincount(pairs, minlength=1 << 16).reshape(256, 256)
+
+
+def entropy_from_counts(counts: np.ndarray) -> np.ndarray:
+    """Entropy in bits of the distribution along the last axis."""
+    counts = np.asarray(counts, dtype=np.float64)
+    totals = counts.sum(axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = counts / totals
+        terms = np.where(counts > 0, p * np.log2(p), 0.0)
+    return -terms.sum(axis=-1)
+
+
+def conditional_entropy(pairs: np.ndarray) -> float:
+    """Entropy of the current byte given the previous one, from a pair
+    histogram: H(previous, current) - H(previous).
+    """
+    joint = entropy_from_counts(pairs.ravel())
+    return float(joint - entropy_from_counts(pairs.sum(axis=1)))
+
+
+def order0_entropy(data) -> float:
+    if not len(as_bytes(data)):
+        return 0.0
+    return float(entropy_from_counts(byte_histogram(data)))
+
+
+def order1_entropy(data) -> float:
+    if len(as_bytes(data)) < 2:
+        return 0.0
+    return conditional_entropy(pair_histogram(data))
+
+
+class ProfileWindow(NamedTuple):
+    offset: int
+    size: int
+    entropy: float
+
+
+def _read_steps(source: IO[bytes], step: int) -> Iterator[bytes]:
+    while True:
+        chunk = source.read(step)
+        if not chunk:
+            return
+        # Raw files may return short reads before the end
+        while len(chunk) < step:
+            more = source.read(step - len(chunk))
+            if not more:
+                break
+            chunk += more
+        yield chunk
+
+
+def entropy_profile(source: IO[bytes], window: int = DEFAULT_WINDOW,
+                    step: Optional[int] = None,
+                    order: int = 0) -> Iterator[ProfileWindow]:
+    """Entropy of every window of `window` bytes of the binary file
+    `source`, one window every `step` bytes.
+
+    The file is read once, a step at a time. Each step is histogrammed
+    once and window histograms are kept as a running sum over the steps
+    they cover, so overlapping windows cost no more than disjoint ones.
+    `step` defaults to `window` and must divide it. The last window may
+    be shorter.
+    """
+    step = step or window
+    if order not in (0, 1):
+        raise ValueError("Entropy profiles support orders 0 and 1.")
+    if step <= 0 or window % step:
+        raise ValueError("Step must be a positive divisor of the window.")
+    steps_per_window = window // step
+    recent: deque = deque()
+    total = None
+    offset = 0
+    size = 0
+    previous: Optional[int] = None
+    for chunk in _read_steps(source, step):
+        if order == 0:
+            counts = byte_histogram(chunk)
+        else:
+            counts = pair_histogram(chunk, previous)
+            previous = chunk[-1]
+        total = counts.copy() if total is None else total + counts
+        recent.append((counts, len(chunk)))
+        size += len(chunk)
+        if len(recent) > steps_per_window:
+            oldest, oldest_size = recent.popleft()
+            total -= oldest
+            size -= oldest_size
+            offset += oldest_size
+        if len(recent) == steps_per_window:
+            yield ProfileWindow(offset, size, _entropy(total, order))
+    if recent and len(recent) < steps_per_window:
+        # Input shorter than one window
+        yield ProfileWindow(offset, size, _entropy(total, order))
+
+
+def _entropy(counts: np.ndarray, order: int) -> float:
+    if not counts.any():
+        return 0.0
+    if order == 0:
+        return float(entropy_from_counts(counts))
+    return conditional_entropy(counts)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="stats.py",
+        description="Profile the byte entropy of a file over sliding "
+                    "windows, to judge how well it will compress.")
+    parser.add_argument("file")
+    parser.add_argument("-w", "--window", type=int, default=DEFAULT_WINDOW,
+                        help="bytes per window")
+    parser.add_argument("-s", "--step", type=int,
+                        help="bytes between window starts (default: the "
+                             "window size)")
+    parser.add_argument("--order", type=int, choices=(0, 1), default=0)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    weighted = 0.0
+    size = 0
+    with open(args.file, "rb") as f:
+        for window in entropy_profile(f, args.window, args.step, args.order):
+            print(f"{window.offset:>14,} {window.size:>12,} "
+                  f"{window.entropy:6.3f} bits/byte")
+            weighted += window.entropy * window.size
+            size += window.size
+    if size:
+        print(f"mean {weighted / size:.3f} bits/byte, about "
+              f"{weighted / size / 8:.1%} of the input size")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+from typing import IO, Any, Callable, Optional
+
+# Encoders and decoders from arithmetic.py and lempel_ziv.py all share the
+# same shape: feed(chunk) returns whatever output is ready and flush()
+# finishes the stream. The wrappers below only rely on that.
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class EncoderWriter:
+    """Write-only file object that encodes everything written to it.
+
+    Encoded bytes go to the binary file `raw` as soon as the encoder
+    releases them. Closing the writer flushes the encoder but leaves `raw`
+    open.
+    """
+
+    def __init__(self, raw: IO[bytes], encoder: Any):
+        self.raw = raw
+        self.encoder = encoder
+        self.closed: bool = False
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed writer.")
+        encoded = self.encoder.feed(data)
+        if encoded:
+            self.raw.write(encoded)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.raw.write(self.encoder.flush())
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DecoderReader:
+    """Read-only file object that decodes the binary file `raw`."""
+
+    def __init__(self, raw: IO[bytes], decoder: Any,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.raw = raw
+        self.decoder = decoder
+        self.chunk_size = chunk_size
+        # Decoders in byte mode produce bytes rather than text
+        self.empty = b"" if getattr(decoder, "byte_mode", False) else ""
+        self.pending = self.empty
+        self.eof: bool = False
+
+    def read(self, size: int = -1):
+        pieces: list = [self.pending]
+        available = len(self.pending)
+        while not self.eof and (size < 0 or available < size):
+            chunk = self.raw.read(self.chunk_size)
+            if chunk:
+                decoded = self.decoder.feed(chunk)
+            else:
+                decoded = self.decoder.flush()
+                self.eof = True
+            pieces.append(decoded)
+            available += len(decoded)
+        data = self.empty.join(pieces)
+        if size < 0:
+            size = len(data)
+        self.pending = data[size:]
+        return data[:size]
+
+    def close(self):
+        self.eof = True
+        self.pending = self.empty
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def encode_stream(source: IO, target: IO[bytes], encoder: Any,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Encode `source` into `target` one chunk at a time.
+
+    Returns the number of bytes written.
+    """
+    written = 0
+    while True:
+        chunk = source.read(chunk_size)
+        encoded = encoder.feed(chunk) if chunk else encoder.flush()
+        target.write(encoded)
+        written += len(encoded)
+        if not chunk:
+            return written
+
+
+def decode_stream(source: IO[bytes], target: IO, decoder: Any,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Decode `source` into `target` one chunk at a time.
+
+    Returns the number of symbols written.
+    """
+    written = 0
+    while True:
+        chunk = source.read(chunk_size)
+        decoded = decoder.feed(chunk) if chunk else decoder.flush()
+        target.write(decoded)
+        written += len(decoded)
+        if not chunk:
+            return written
+
+
+class CodingCancelled(Exception):
+    """Raised by `code_chunks` when its job is cancelled."""
+
+
+def code_chunks(coder: Any, data, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                progress: Optional[Callable[[int, int], None]] = None,
+                cancelled: Optional[Callable[[], bool]] = None):
+    """Run all of `data` through a streaming encoder or decoder.
+
+    `progress(done, total)` is called after every chunk, and `cancelled()`
+    is checked before every chunk so a long job can be stopped from
+    another thread; it raises `CodingCancelled` when it returns true.
+    """
+    pieces = []
+    total = len(data)
+    for start in range(0, total, chunk_size):
+        if cancelled is not None and cancelled():
+            raise CodingCancelled()
+        pieces.append(coder.feed(data[start:start + chunk_size]))
+        if progress is not None:
+            progress(min(start + chunk_size, total), total)
+    pieces.append(coder.flush())
+    # Encoders give bytes, decoders bytes or text
+    return pieces[-1][:0].join(pieces)
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from arithmetic import (
+    ArithmeticDecoder, ArithmeticEncoder, context_arithmetic_decode,
+    context_arithmetic_encode, integer_arithmetic_decode,
+    integer_arithmetic_encode
+)
+from models import (
+    DEFAULT_TABLE_SIZE, MIN_TABLE_SIZE, AdaptiveModel, context_table_size
+)
+
+
+class CountingModel(AdaptiveModel):
+    """Finds symbols by a linear scan and counts the calls it gets."""
+
+    def __init__(self, size: int):
+        super().__init__(size)
+        self.calls = {"interval": 0, "find": 0, "update": 0}
+
+    def interval(self, symbol: int):
+        self.calls["interval"] += 1
+        return super().interval(symbol)
+
+    def find(self, target: int) -> int:
+        self.calls["find"] += 1
+        high = 0
+        for symbol, count in enumerate(self.counts):
+            high += count
+            if target < high:
+                return symbol
+        raise ValueError("Target outside the model's total.")
+
+    def update(self, symbol: int):
+        self.calls["update"] += 1
+        super().update(symbol)
+
+
+def test_round_trip_bytes_and_text():
+    rng = random.Random(0)
+    data = bytes(rng.choice(b"aaab\x00\xff") for _ in range(5000))
+    encoded = integer_arithmetic_encode(data)
+    assert integer_arithmetic_decode(encoded, None, len(data)) == data
+    text = "".join(rng.choice("abcdé") for _ in range(3000))
+    encoded = integer_arithmetic_encode(text)
+    assert integer_arithmetic_decode(
+        encoded, sorted(set(text)), len(text)) == text
+
+
+def test_overridden_model_methods_are_called():
+    rng = random.Random(1)
+    data = rng.randbytes(2000)
+    encoder_model = CountingModel(256)
+    encoded = integer_arithmetic_encode(data, encoder_model)
+    assert encoder_model.calls["interval"] == len(data)
+    assert encoder_model.calls["update"] == len(data)
+    # The bitstream is the same as the inline path's
+    assert encoded == integer_arithmetic_encode(data)
+
+    decoder_model = CountingModel(256)
+    assert integer_arithmetic_decode(
+        encoded, None, len(data), decoder_model) == data
+    assert decoder_model.calls["find"] == len(data)
+
+
+def test_streaming_coders_reject_model_subclasses():
+    with pytest.raises(TypeError):
+        ArithmeticEncoder(None, CountingModel(256))
+    with pytest.raises(TypeError):
+        ArithmeticDecoder(None, 10, CountingModel(256))
+
+
+def test_context_table_follows_input_length():
+    assert context_table_size(0) == MIN_TABLE_SIZE
+    assert context_table_size(5) == MIN_TABLE_SIZE
+    assert context_table_size(4096) == 4096
+    assert context_table_size(4097) == 8192
+    assert context_table_size(10 ** 7) == DEFAULT_TABLE_SIZE
+    assert context_table_size(10 ** 7, 1 << 10) == 1 << 10
+
+
+@pytest.mark.parametrize("length", [0, 1, 5, 3000])
+def test_context_round_trip(length):
+    data = random.Random(length).randbytes(length)
+    encoded = context_arithmetic_encode(data, order=3)
+    assert context_arithmetic_decode(
+        encoded, None, length, order=3) == data
@@ -0,0 +1,67 @@
+import io
+import random
+
+import pytest
+
+from container import (
+    BlockInfo, ContainerReader, ContainerWriter, CorruptedBlockError,
+    read_container, write_container
+)
+
+
+def sample(size: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    words = [rng.randbytes(rng.randint(2, 9)) for _ in range(30)]
+    out = bytearray()
+    while len(out) < size:
+        out += rng.choice(words)
+    return bytes(out[:size])
+
+
+@pytest.mark.parametrize("codec", ["lz", "lzw", "lzss", "arithmetic"])
+def test_chunked_write_matches_whole_write(codec):
+    data = sample(5000)
+    whole = write_container(data, codec, block_size=1024)
+    raw = io.BytesIO()
+    rng = random.Random(1)
+    with ContainerWriter(raw, codec, None, block_size=1024) as writer:
+        position = 0
+        while position < len(data):
+            step = rng.randint(1, 1500)
+            writer.write(data[position:position + step])
+            position += step
+    assert raw.getvalue() == whole
+    assert read_container(whole) == data
+
+
+def test_text_container_round_trip():
+    text = "abracadabra, " * 300
+    encoded = write_container(text, "lz", block_size=500)
+    assert read_container(encoded) == text
+
+
+def test_corrupted_block_is_detected():
+    data = sample(4096, seed=2)
+    encoded = bytearray(write_container(data, "lz", block_size=1024))
+    reader = ContainerReader(encoded)
+    damaged: BlockInfo = reader.blocks[2]
+    encoded[damaged.offset + damaged.size // 2] ^= 0xFF
+
+    reader = ContainerReader(encoded)
+    with pytest.raises(CorruptedBlockError) as excinfo:
+        reader.read_block(2)
+    assert excinfo.value.index == 2
+    # The other blocks are still readable
+    for index in (0, 1, 3):
+        start = index * 1024
+        assert reader.read_block(index) == data[start:start + 1024]
+
+
+def test_corrupted_index_is_detected():
+    encoded = bytearray(write_container(sample(2048), "lz", block_size=1024))
+    reader = ContainerReader(encoded)
+    # Flip a bit of the first index entry, just past the last block
+    last = reader.blocks[-1]
+    encoded[last.offset + last.size] ^= 0x01
+    with pytest.raises(ValueError):
+        ContainerReader(encoded)
@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+from lempel_ziv import (
+    LZ_POLICIES, LZSS_LEVELS, Wordbook, lz_decode, lz_encode, lzss_decode,
+    lzss_encode
+)
+
+
+def sample(size: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    words = [rng.randbytes(rng.randint(2, 12)) for _ in range(40)]
+    out = bytearray()
+    while len(out) < size:
+        word = bytearray(rng.choice(words))
+        if rng.random() < 0.1:
+            word[rng.randrange(len(word))] = rng.randrange(256)
+        out += word
+    return bytes(out[:size])
+
+
+@pytest.mark.parametrize("policy", LZ_POLICIES)
+@pytest.mark.parametrize("max_entries", [2, 3, 16, 257])
+def test_policies_round_trip_at_small_sizes(policy, max_entries):
+    data = sample(6000)
+    encoded = lz_encode(data, None, max_entries, policy)
+    assert lz_decode(encoded, None, max_entries, policy) == data
+
+
+@pytest.mark.parametrize("policy", LZ_POLICIES)
+def test_policies_round_trip_text(policy):
+    text = "the quick brown fox jumps over the lazy dog " * 40
+    alphabet = sorted(set(text))
+    encoded = lz_encode(text, alphabet, 32, policy)
+    assert lz_decode(encoded, alphabet, 32, policy) == text
+
+
+def test_policies_differ_once_full():
+    data = sample(6000, seed=3)
+    encoded = {policy: lz_encode(data, None, 64, policy)
+               for policy in LZ_POLICIES}
+    assert len(set(encoded.values())) == len(LZ_POLICIES)
+
+
+@pytest.mark.parametrize("policy", LZ_POLICIES)
+def test_wordbook_stays_within_max_entries(policy):
+    wordbook = Wordbook(8, policy)
+    rng = random.Random(4)
+    for _ in range(200):
+        parent = rng.randrange(len(wordbook))
+        wordbook.add(parent, rng.randrange(256))
+        assert len(wordbook) <= 8
+
+
+@pytest.mark.parametrize("level", sorted(LZSS_LEVELS))
+def test_lzss_levels_round_trip(level):
+    data = sample(8000, seed=level)
+    encoded = lzss_encode(data, level=level)
+    assert lzss_decode(encoded) == data
+    text = "she sells sea shells by the sea shore " * 30
+    alphabet = sorted(set(text))
+    encoded = lzss_encode(text, alphabet, level=level)
+    assert lzss_decode(encoded, alphabet) == text
+
+
+def test_lzss_higher_levels_do_not_compress_worse():
+    data = sample(20000, seed=5)
+    sizes = [len(lzss_encode(data, level=level)) for level in (1, 9)]
+    assert sizes[1] <= sizes[0]
+
+
+def test_lzss_rejects_unknown_level():
+    with pytest.raises(ValueError):
+        lzss_encode(b"abc", level=0)
@@ -0,0 +1,77 @@
+import io
+import random
+
+import pytest
+
+from arithmetic import (
+    ArithmeticDecoder, ArithmeticEncoder, integer_arithmetic_encode
+)
+from lempel_ziv import LZDecoder, LZEncoder, lz_encode
+from streams import DecoderReader, EncoderWriter, code_chunks
+
+
+def sample(size: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    words = [rng.randbytes(rng.randint(2, 10)) for _ in range(30)]
+    out = bytearray()
+    while len(out) < size:
+        out += rng.choice(words)
+    return bytes(out[:size])
+
+
+def feed_in_pieces(coder, data, seed: int):
+    rng = random.Random(seed)
+    pieces = []
+    position = 0
+    while position < len(data):
+        step = rng.randint(1, 700)
+        pieces.append(coder.feed(data[position:position + step]))
+        position += step
+    pieces.append(coder.flush())
+    return pieces[-1][:0].join(pieces)
+
+
+@pytest.mark.parametrize("policy,max_entries", [
+    ("reset", None), ("reset", 64), ("freeze", 64), ("lru", 64)])
+def test_lz_streaming_matches_one_shot(policy, max_entries):
+    data = sample(8000)
+    one_shot = lz_encode(data, None, max_entries, policy)
+    streamed = feed_in_pieces(LZEncoder(None, max_entries, policy), data, 1)
+    assert streamed == one_shot
+    decoder = LZDecoder(None, max_entries, policy)
+    assert feed_in_pieces(decoder, one_shot, 2) == data
+
+
+def test_lz_streaming_text():
+    text = "to be or not to be, that is the question " * 50
+    alphabet = sorted(set(text))
+    one_shot = lz_encode(text, alphabet)
+    assert feed_in_pieces(LZEncoder(alphabet), text, 3) == one_shot
+    assert feed_in_pieces(LZDecoder(alphabet), one_shot, 4) == text
+
+
+def test_arithmetic_streaming_matches_one_shot():
+    data = sample(8000, seed=5)
+    one_shot = integer_arithmetic_encode(data)
+    assert feed_in_pieces(ArithmeticEncoder(None), data, 6) == one_shot
+    decoder = ArithmeticDecoder(None, len(data))
+    assert feed_in_pieces(decoder, one_shot, 7) == data
+
+
+def test_file_wrappers_round_trip():
+    data = sample(20000, seed=8)
+    raw = io.BytesIO()
+    with EncoderWriter(raw, LZEncoder(None)) as writer:
+        for start in range(0, len(data), 3000):
+            writer.write(data[start:start + 3000])
+    assert raw.getvalue() == lz_encode(data)
+    raw.seek(0)
+    reader = DecoderReader(raw, LZDecoder(None), chunk_size=512)
+    assert reader.read(100) + reader.read() == data
+
+
+def test_code_chunks_matches_one_shot():
+    data = sample(10000, seed=9)
+    encoded = code_chunks(LZEncoder(None), data, chunk_size=999)
+    assert encoded == lz_encode(data)
+    assert code_chunks(LZDecoder(None), encoded, chunk_size=77) == data
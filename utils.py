@@ -1,6 +1,52 @@
-from typing import List, Optional, Tuple
+from collections import Counter
+from typing import List, Optional
 import math
 
+# Byte mode: symbols are the byte values themselves, so the alphabet is all
+# 256 of them and a symbol's index in the alphabet is its value
+BYTE_ALPHABET = range(256)
+
+
+def is_byte_data(sequence) -> bool:
+    return isinstance(sequence, (bytes, bytearray, memoryview))
+
+
+def byte_view(data) -> memoryview:
+    """Flat view of the unsigned bytes of `data`, without copying."""
+    view = memoryview(data)
+    if view.format == "B" and view.ndim == 1:
+        return view
+    return view.cast("B")
+
+
+def resolve_alphabet(sequence, alphabet: Optional[list]):
+    """The alphabet to code `sequence` with.
+
+    Bytes-like input without an alphabet uses all 256 byte values, so no
+    pass over the data is needed to discover its symbols.
+    """
+    if alphabet is not None:
+        return alphabet
+    if is_byte_data(sequence):
+        return BYTE_ALPHABET
+    raise ValueError("Text input needs an alphabet.")
+
+
+def symbol_buffer(alphabet: Optional[list], length: int = 0):
+    """Room for `length` decoded symbols, to be passed to `decode_symbols`."""
+    return bytearray(length) if alphabet is None else [""] * length
+
+
+def decode_symbols(symbols, alphabet: Optional[list]):
+    """The decoded sequence made of `symbols`.
+
+    Without an alphabet the symbols are byte values and come back as
+    bytes; otherwise they are text symbols and are joined into a string.
+    """
+    if alphabet is None:
+        return bytes(symbols)
+    return "".join(symbols)
+
 
 def float_decimal_to_binary(decimal: int, length: int) -> str:
     """
@@ -23,51 +69,25 @@ def binary_to_float_decimal(binary: str) -> float:
     return dec
 
 
-def integer_decimal_to_binary(value: int) -> int:
-    if value == 0:
-        return "0"
-    ret = ""
-    while value > 0:
-        ret = str(value % 2) + ret
-        value //= 2
-    return ret
-
-
-def binary_to_integer_decimal(binary: str) -> int:
-    dec = 0
-    length = len(binary)
-    for i, bit in enumerate(binary):
-        dec += int(bit) * (2 ** (length - i - 1))
-    return dec
-
-
 def calculate_distribution(sequence: str) -> dict:
-    # A bit redundant but does the work
-    symbols = sorted(list(set(sequence)))
-    probabilities = [sequence.count(sigma)/len(sequence) for sigma in symbols]
-    return dict(zip(symbols, probabilities))
-
-
-def window_match(sequence: str,
-                 wordbook: List[str]) -> Optional[Tuple[str, int]]:
-    # This is not a generic function, only works for Lempel-Ziv use case
-    matches = [s for s in wordbook if sequence.startswith(s)]
-    word = max(matches, key=len) if matches else sequence[0]
-    index = wordbook.index(word) if matches else 1
-    return word, index
-
-
-def symbol_to_binary(symbol: str, length: int, index: int) -> str:
-    """Convert a symbol to its binary representation.
-
-    :symbol: The symbol to convert.
-    :length: The length of the binary representation.
-    :index: The index of the symbol in the symbol list.
-    :returns: The binary representation of the symbol as a string.
-
-    """
-    binary = bin(index)[2:].zfill(length)
-    return binary
+    if is_byte_data(sequence):
+        # One counting pass over the byte values instead of one per symbol
+        counts = Counter(byte_view(sequence))
+        return {sigma: counts[sigma] / len(sequence) for sigma in sorted(counts)}
+    # One counting pass, not one `count` per distinct symbol
+    counts = Counter(sequence)
+    return {sigma: counts[sigma] / len(sequence) for sigma in sorted(counts)}
+
+
+def calculate_entropy(sequence) -> float:
+    """Empirical order-0 entropy of `sequence`, in bits per symbol."""
+    if is_byte_data(sequence):
+        sequence = byte_view(sequence)
+    total = len(sequence)
+    if not total:
+        return 0.0
+    return -sum(count / total * math.log2(count / total)
+                for count in Counter(sequence).values())
 
 
 def calculate_efficiency(probabilities: List[float],
@@ -0,0 +1,45 @@
+import threading
+from typing import Any, Callable
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+from streams import CodingCancelled
+
+# A job is called as job(progress, cancelled) on a pool thread, in the shape
+# `streams.code_chunks` takes them: progress(done, total) after each chunk
+# and cancelled() checked before the next one.
+Job = Callable[[Callable[[int, int], None], Callable[[], bool]], Any]
+
+
+class WorkerSignals(QObject):
+    """Signals of a `CodecWorker`, delivered on the GUI thread."""
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class CodecWorker(QRunnable):
+    """Runs one encode or decode job off the GUI thread."""
+
+    def __init__(self, job: Job):
+        super().__init__()
+        self.job = job
+        self.signals = WorkerSignals()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Stop the job at its next chunk boundary."""
+        self._cancel.set()
+
+    def run(self):
+        try:
+            result = self.job(self.signals.progress.emit,
+                              self._cancel.is_set)
+        except CodingCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)